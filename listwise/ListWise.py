@@ -7,9 +7,20 @@ Created on Wed Sep 21 11:31:36 2016
 import os
 import sqlite3
 import requests
+import numpy as np
 import pandas as pd
 from time import sleep
-from .SimpleSQLite3 import SimpleSQLite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .SimpleSQLite3 import SimpleSQLite3, DEFAULT_CACHED_STATEMENTS
+from .singleflight import SingleFlight
+from . import fileio
+from . import dedup
+from .freshness import FreshnessPolicy
+from .backends import SQLiteBackend, make_record
+from .writebehind import WriteBehindWriter, DEFAULT_MAX_QUEUE
+from . import sync
+from .snapshot import EmailSnapshot, CLEAN_CODES, STATUS_NAMES, hash_emails
             
 #======================================================#
 """These lists provide information to the ListWise.parse_email method. """
@@ -35,7 +46,8 @@ EMAILS_SQL_TABLE = """CREATE TABLE emails (
     dealno       INT (30)     DEFAULT (0),
     clean_type   INT (30)     DEFAULT (0),
     email_id     INTEGER      PRIMARY KEY ON CONFLICT REPLACE AUTOINCREMENT,
-    updatedate   DATETIME     DEFAULT (DATETIME('now', 'localtime') ) 
+    updatedate   DATETIME     DEFAULT (DATETIME('now', 'localtime') ),
+    change_seq   INTEGER
 );"""
 
 DOMAINS_SQL_TABLE = """CREATE TABLE domains (
@@ -43,7 +55,57 @@ DOMAINS_SQL_TABLE = """CREATE TABLE domains (
     domain VARCHAR(30) UNIQUE ON CONFLICT IGNORE, 
     valid INT(1))"""
               
-TABLE_STRUCTURES = {'emails':EMAILS_SQL_TABLE, 'domains': DOMAINS_SQL_TABLE}
+# Emails waiting for ListWise.refresh_stale to re-verify them.
+REFRESH_QUEUE_SQL_TABLE = """CREATE TABLE refresh_queue (
+    email      VARCHAR (30) PRIMARY KEY ON CONFLICT IGNORE,
+    clean_type INT (30)     DEFAULT (1),
+    queuedate  DATETIME     DEFAULT (DATETIME('now', 'localtime') )
+)"""
+              
+TABLE_STRUCTURES = {'emails':EMAILS_SQL_TABLE, 'domains': DOMAINS_SQL_TABLE,
+                    'refresh_queue': REFRESH_QUEUE_SQL_TABLE}
+
+# Record counts per (dealno, clean_type, email_status) kept current by triggers on emails 
+# so deal summaries don't scan the emails table. Created & backfilled in one transaction.
+DEAL_STATUS_COUNTS = 'deal_status_counts'
+DEAL_STATUS_COUNTS_SQL = [
+"""CREATE TABLE deal_status_counts (
+    dealno       INT (30)     NOT NULL,
+    clean_type   INT (30)     NOT NULL,
+    email_status VARCHAR (30) NOT NULL,
+    records      INTEGER      DEFAULT (0),
+    PRIMARY KEY (dealno, clean_type, email_status)
+)""",
+"""CREATE TRIGGER IF NOT EXISTS emails_count_insert AFTER INSERT ON emails
+BEGIN
+    INSERT INTO deal_status_counts (dealno, clean_type, email_status, records)
+    VALUES (IFNULL(NEW.dealno, 0), IFNULL(NEW.clean_type, 0), IFNULL(NEW.email_status, ''), 1)
+    ON CONFLICT (dealno, clean_type, email_status) DO UPDATE SET records = records + 1;
+END""",
+"""CREATE TRIGGER IF NOT EXISTS emails_count_delete AFTER DELETE ON emails
+BEGIN
+    UPDATE deal_status_counts SET records = records - 1
+    WHERE dealno = IFNULL(OLD.dealno, 0) AND clean_type = IFNULL(OLD.clean_type, 0)
+      AND email_status = IFNULL(OLD.email_status, '');
+END""",
+"""CREATE TRIGGER IF NOT EXISTS emails_count_update AFTER UPDATE OF dealno, clean_type, email_status ON emails
+WHEN OLD.dealno IS NOT NEW.dealno OR OLD.clean_type IS NOT NEW.clean_type OR OLD.email_status IS NOT NEW.email_status
+BEGIN
+    UPDATE deal_status_counts SET records = records - 1
+    WHERE dealno = IFNULL(OLD.dealno, 0) AND clean_type = IFNULL(OLD.clean_type, 0)
+      AND email_status = IFNULL(OLD.email_status, '');
+    INSERT INTO deal_status_counts (dealno, clean_type, email_status, records)
+    VALUES (IFNULL(NEW.dealno, 0), IFNULL(NEW.clean_type, 0), IFNULL(NEW.email_status, ''), 1)
+    ON CONFLICT (dealno, clean_type, email_status) DO UPDATE SET records = records + 1;
+END""",
+"""INSERT INTO deal_status_counts (dealno, clean_type, email_status, records)
+    SELECT IFNULL(dealno, 0), IFNULL(clean_type, 0), IFNULL(email_status, ''), COUNT(*)
+    FROM emails GROUP BY 1, 2, 3"""]
+
+# Named statements prepared on the database (see SimpleSQLite3.prepare).
+STATEMENTS = {'refresh_queue.insert': "INSERT INTO refresh_queue (email, clean_type) VALUES (?,?)",
+              'refresh_queue.select': "SELECT email FROM refresh_queue WHERE clean_type = ? ORDER BY queuedate LIMIT ?",
+              'refresh_queue.delete': "DELETE FROM refresh_queue WHERE email = ?"}
 
 # Table names are emails, field names are email
 email, emails, email2, emails2 = 'email', 'emails', 'email2', 'emails2'
@@ -71,12 +133,43 @@ SUSPICIOUS = 'suspicious'
 UNKNOWN = 'unknown'
 
 
+# ListWise API endpoints (also the names of the rate limiter buckets)
+DEEP = 'deep'
+QUICK = 'quick'
+API_URL = "https://api.listwisehq.com/clean/{}.php?email={}&api_key={}"
+
 FREE_MAIL = 'free_mail'
 TYPO_FIXED = 'typo_fixed'
 ERROR_CODE = 'error_code'
 
 class InvalidCredentialsError(Exception): pass
     
+
+def parse_email(email):
+    """See ListWise.parse_email."""
+    if not email:
+        return ''
+        
+    email = str(email).lower().replace('.comhome','.com')
+    
+    for item in EMAIL_CHARS_TO_SPLIT:
+        if item in email:
+            email = email.split(item)[0]
+            
+    for item in ILLEGAL_SCRUB_ITEMS:
+        if item in email:
+            return ''
+            
+    if not "@" in email:
+        return ''
+    elif not "." in email:
+        return ''
+    elif not len(email) > 5:
+        return ''
+        
+    return email
+
+
 class ListWise:
     """ 
     A python class wrapping the API to ListWise e-mail address cleaner. 
@@ -87,17 +180,61 @@ class ListWise:
     database and valid e-mails are returned to the DataFrame.
     Invalid e-mails are replaced with nothing.
     This process seems to take about 0.75 seconds per e-mail address.     
+
+    Pass a listwise.ratelimit.RateLimiter as rate_limiter to keep 
+    API calls under the provider's throttle.
+    
+    Pass a listwise.freshness.FreshnessPolicy as freshness to stop 
+    trusting cached verdicts after a max age per status.
+    
+    Pass a listwise.backends.CacheBackend as backend to store verdicts 
+    somewhere other than the emails table of the database at database_path.
+    
+    Pass a listwise.canonical.Canonicalizer as canonicalizer to cache 
+    (and pay for) addresses reaching the same mailbox only once, 
+    e.g. john.doe+promo@gmail.com & johndoe@gmail.com.
+    
+    cached_statements is the size of the connection's compiled statement cache.
+    
+    Pass a listwise.cassette.RecordingTransport/ReplayTransport as transport 
+    to record API traffic or replay it offline. Any object with a get(url) 
+    method returning a response with status_code & json() works.
+    
+    Pass write_behind=True (or the max number of queued records) to write
+    API responses (and deletes & refresh queue changes) from a background 
+    thread with its own connection, in batched transactions. flush() (or leaving a with block) waits until 
+    they are committed, the *_clean_frame methods flush before returning.
     """
-    def __init__(self, database_path, username=None, api_key=None, test_credentials=True):
+    def __init__(self, database_path, username=None, api_key=None, test_credentials=True, rate_limiter=None,
+                 freshness=None, backend=None, canonicalizer=None, cached_statements=DEFAULT_CACHED_STATEMENTS,
+                 transport=None, write_behind=False):
         self._api_key = api_key
+        self._transport = (transport if transport is not None else requests)
+        self._canonicalizer = canonicalizer
+        self._rate_limiter = rate_limiter
+        self._freshness = freshness
         self._username = username
         self._db_path = database_path
         self._queued_emails = []
         self._bad_emails = []
         self._errored_responses = {}
-        self._db = SimpleSQLite3(self._db_path)
+        self._flight = SingleFlight()
+        self._metrics = Counter()
+        self._email_index = None
+        self._email_index_version = None
+        self._db = self._connect(cached_statements)
         self._db.set_row_factory(sqlite3.Row)
         self._create_tables()
+        for name, sql in STATEMENTS.items():
+            self._db.prepare(name, sql)
+        self._backend = (backend if backend is not None else SQLiteBackend(self._db, summary_table=DEAL_STATUS_COUNTS))
+        self._writer = None
+        self._sql_writer = None # The writer when it writes to this database file.
+        if write_behind:
+            self._writer = WriteBehindWriter(self._writer_backend_factory(cached_statements),
+                                             max_queue=(DEFAULT_MAX_QUEUE if write_behind is True else int(write_behind)))
+            if isinstance(self._backend, SQLiteBackend) and self._backend.db is self._db:
+                self._sql_writer = self._writer
         if test_credentials:
             self.test_credentials()
         
@@ -106,6 +243,48 @@ class ListWise:
         """The connection to PandaLite/SQLite database. """
         return self._db
         
+    @property
+    def backend(self):
+        """The listwise.backends.CacheBackend storing email verdicts. """
+        return self._backend
+        
+    def _connect(self, cached_statements=DEFAULT_CACHED_STATEMENTS):
+        """
+        Opens a SimpleSQLite3 connection to the database. Recursive triggers are on 
+        so rows replaced by ON CONFLICT REPLACE fire the emails delete trigger.
+        The connection can be used from any thread, so threads calling 
+        deep_clean_one2 etc. on one instance share in-flight API calls.
+        """
+        db = SimpleSQLite3(self._db_path, cached_statements=cached_statements, check_same_thread=False)
+        db.cur.execute("PRAGMA recursive_triggers = ON")
+        return db
+        
+    def _writer_backend_factory(self, cached_statements):
+        """The write-behind thread gets its own connection to the database (other backends are shared). """
+        backend = self._backend
+        if isinstance(backend, SQLiteBackend) and backend.db is self._db:
+            return lambda: SQLiteBackend(self._connect(cached_statements), table=backend.table,
+                                         summary_table=backend.summary_table)
+        return lambda: backend
+        
+    def flush(self):
+        """Blocks until every response queued for the write-behind writer is committed. """
+        if self._writer is not None:
+            self._writer.flush()
+            
+    def close(self):
+        """Flushes & stops the write-behind writer, if any. """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._sql_writer = None
+            
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *args):
+        self.close()
+        
     def test_credentials(self):
         """Checks a ListWise API response and 
         raises an InvalidCredentialsError if the credentials
@@ -121,17 +300,31 @@ class ListWise:
             if not self.db.sql_exists(table):
                 with self.db.con:
                     self.db.cur.execute(contents)
+        if not self.db.sql_exists(DEAL_STATUS_COUNTS):
+            with self.db.con:
+                self.db.cur.execute("BEGIN")
+                for sql in DEAL_STATUS_COUNTS_SQL:
+                    self.db.cur.execute(sql)
+        sync.create_sync_tables(self.db)
             
-    def _insert_response(self, r, dealno=0, clean_type=0, table=EMAILS):
+    def _insert_response(self, r, dealno=0, clean_type=0, table=EMAILS, key=None):
         """ 
         r: response dictionary from self._quick_clean or self._deep_clean
         dealno: default (0), the deal number of the deal for the data being processed.
         clean_type: 0 = quick_clean, 1 = deep_clean
+        key: default (None), the cache key to store the response under instead of r['email'] 
+            (which the API may have changed, e.g. by fixing a typo).
+        
+        Existing records are updated in place so insertdate is kept 
+        and updatedate records when the verdict was last refreshed.
         """    
-        sql = """INSERT INTO {} (email,email_status,free_mail,typo_fixed,dealno,clean_type) 
-                VALUES ('{}','{}','{}','{}',{},{});""".format(
-                table, r[EMAIL], r[EMAIL_STATUS], r[FREE_MAIL], r[TYPO_FIXED], dealno, clean_type)
-        self.db.cur.execute(sql)
+        record = make_record(r, dealno=dealno, clean_type=clean_type)
+        if key:
+            record[EMAIL] = key
+        if table == EMAILS and self._writer is not None:
+            return self._writer.put(record)
+        backend = (self.backend if table == EMAILS else SQLiteBackend(self.db, table=table))
+        backend.put_many([record])
         
     def _parse_valid_response(self, email, resp):
         try:
@@ -161,72 +354,223 @@ class ListWise:
         Returns the lowercased email address if tests pass.
         Returns an empty string if a test fails.
         """
-        if not email:
-            return ''
-            
-        email = str(email).lower().replace('.comhome','.com')
+        return parse_email(email)
         
-        for item in EMAIL_CHARS_TO_SPLIT:
-            if item in email:
-                email = email.split(item)[0]
-                
-        for item in ILLEGAL_SCRUB_ITEMS:
-            if item in email:
-                return ''
-                
-        if not "@" in email:
-            return ''
-        elif not "." in email:
-            return ''
-        elif not len(email) > 5:
-            return ''
-            
-        return email
+    def cache_key(self, email):
+        """
+        Returns the key a parsed email is cached & verified under:
+        its canonical form when a canonicalizer is set, otherwise the email.
+        """
+        if self._canonicalizer is None or not email:
+            return email
+        return self._canonicalizer.canonicalize(email)
+        
+    def _restore_email(self, email, result):
+        """
+        Maps a result cleaned under the cache key back to the caller's email 
+        (with any domain typo repaired) so outputs keep the original address.
+        A result that differs from the cache key was changed by the API 
+        (e.g. a typo it fixed) and is returned as-is.
+        """
+        if self._canonicalizer is None or not result or result != self.cache_key(email):
+            return result
+        return self._canonicalizer.repair(email)
         
-    def pre_process_frame(self, df, col=None):
+    def pre_process_frame(self, df, col=None, max_memory=None, spill_dir=None):
         """Runs class method parse_email, 
         drops duplicates, 
-        and then drops records with no email address. """
+        and then drops records with no email address. 
+        
+        max_memory - (int) optional number of bytes the duplicate check may use.
+            Large frames are hash-partitioned into spill files in spill_dir 
+            (default temp directory) and de-duplicated one partition at a time.
+            The result is the same as the in-memory path."""
         col = (EMAIL if not col else col)
         df.loc[:,col] = df.loc[:,col].apply(self.parse_email)
-        df.drop_duplicates([col],inplace=True)
+        if max_memory:
+            df = df[~dedup.duplicated(df[col].values, max_memory=max_memory, spill_dir=spill_dir)]
+        else:
+            df.drop_duplicates([col],inplace=True)
         return self.drop_missing_emails(df,col=col)
 
+    def _call_api(self, endpoint, email):
+        """
+        Requests an endpoint of the ListWise API (through self._transport) 
+        and returns the JSON response.
+        When a rate limiter is set, waits for a token first and retries 
+        throttled responses up to rate_limiter.max_retries times.
+        """
+        url = API_URL.format(endpoint, email, self._api_key)
+        limiter = self._rate_limiter
+        if limiter is None:
+            return self._transport.get(url).json()
+        
+        tries = 0
+        while True:
+            limiter.acquire(endpoint)
+            r = self._transport.get(url)
+            try:
+                data = r.json()
+            except ValueError:
+                data = {ERROR_CODE: r.status_code, 'error_msg': r.text}
+            throttled = limiter.report(endpoint, r.status_code, data)
+            if not throttled or tries >= limiter.max_retries:
+                return data
+            tries += 1
+            
     def _quick_clean(self, email):
-        url = "https://api.listwisehq.com/clean/quick.php?email={}&api_key={}".format(email, self._api_key)
-        return requests.get(url).json()
+        return self._call_api(QUICK, email)
         
     def _deep_clean(self, email):
-        url = "https://api.listwisehq.com/clean/deep.php?email={}&api_key={}".format(email, self._api_key)
-        return requests.get(url).json()
+        return self._call_api(DEEP, email)
+        
+    def _fetch(self, email, clean_type=1):
+        """
+        Calls the deep (clean_type=1) or quick (clean_type=0) API for an email.
+        Concurrent calls for the same (email, clean_type) are coalesced 
+        so only the first caller pays for the request.
+        """
+        func = (self._deep_clean if clean_type == 1 else self._quick_clean)
+        return self._flight.do((email, clean_type), func, email)
+        
+    @property
+    def single_flight_stats(self):
+        """
+        Returns {'calls': API requests made, 'shared': requests saved by 
+        handing a concurrent caller the result of an in-flight request}
+        """
+        return self._flight.stats()
+        
+    @property
+    def metrics(self):
+        """
+        Returns a dictionary of counters collected by clean_series:
+        cache_hits, cache_misses, api_errors plus the single flight 
+        calls (API requests made) & shared (API requests saved).
+        """
+        data = dict(self._metrics)
+        data.update(self._flight.stats())
+        if self._writer is not None:
+            data.update(self._writer.stats())
+        return data
+        
+    def _execute_write(self, name, params=()):
+        """
+        Runs a prepared write statement on the database. With a write-behind 
+        writer on this database it is queued for the writer thread, so this 
+        connection never holds a write lock the writer is waiting on.
+        """
+        if self._sql_writer is not None:
+            return self._sql_writer.execute(self.db.statement(name), params)
+        self.db.execute(name, params)
         
     def delete_email(self, email):
         """Deletes an email address from the emails table.
-        You must commit/rollback the transaction on your own."""
-        sql = "DELETE FROM emails WHERE email = '{}'".format(
-                email)
-        self.db.cur.execute(sql)
+        You must commit/rollback the transaction on your own 
+        (with write_behind the writer commits it, see flush)."""
+        if self._writer is not None:
+            return self._writer.delete([email])
+        self.backend.delete([email])
         
     def check_db(self, email, clean_type=1):
         """
         Checks the database for a matching clean/catchall status email address.
         If one is found, it is returned as {'email': 'email@example.com'}
         Returns None if no match was found.
+        
+        With a freshness policy, expired matches are treated as missing 
+        or (policy.serve_stale) returned and queued for refresh_stale.
+        With a canonicalizer the canonical form of the email is looked up.
         """
-        try:
-            sql = """
-                  SELECT * FROM emails WHERE email = '{}' 
-                  AND clean_type = {}
-                  AND email_status IN('clean','catch-all')
-                  LIMIT 1
-                  """.format(email, clean_type)
-            self.db.cur.execute(sql)
-            resp = self.db.cur.fetchone()
-            if resp:
-                return {EMAIL:resp[EMAIL]}
-        except:
-            print("sql error: {}".format(sql))
+        key = self.cache_key(email)
+        return self._cached_verdict(key, self._get_many([key]).get(key, None), clean_type=clean_type)
+        
+    def _get_many(self, keys):
+        """backend.get_many including responses the write-behind writer hasn't written yet. """
+        records = self.backend.get_many(keys)
+        if self._writer is not None:
+            for key, record in self._writer.pending(keys).items():
+                if record is None: # Queued for deletion.
+                    records.pop(key, None)
+                else:
+                    records[key] = record
+        return records
+        
+    def _cached_verdict(self, email, record, clean_type=1):
+        """The check_db logic applied to a record from the backend (or None). """
+        if not record or record['clean_type'] != clean_type or record[EMAIL_STATUS] not in (CLEAN, CATCHALL):
             return None
+        policy = self._freshness
+        if policy is not None and policy.is_stale(record[EMAIL_STATUS], record['updatedate']):
+            self._metrics['stale'] += 1
+            if not policy.serve_stale:
+                return None
+            self.queue_refresh(email, clean_type=clean_type)
+        return {EMAIL:record[EMAIL]}
+            
+    def queue_refresh(self, email, clean_type=1):
+        """Queues an email to be re-verified by refresh_stale.
+        You must commit/rollback the transaction on your own."""
+        self._execute_write('refresh_queue.insert', (email, clean_type))
+        
+    def refresh_stale(self, budget=100, clean_type=1, statuses=(CLEAN, CATCHALL), off_peak_hours=None):
+        """
+        Re-verifies cached verdicts against the API, intended to run 
+        as a low priority job (cron, listwise refresh) outside customer runs.
+        Emails queued by check_db go first, then the expired entries with 
+        the given statuses, oldest first.
+        
+        PARAMETERS:
+        ============
+        budget - (int) the max number of API calls to make.
+        
+        clean_type - (int) 1 = deep clean, 0 = quick clean.
+        
+        statuses - (tuple) the expired statuses worth paying to refresh, 
+            defaults to the ones we serve as valid (clean, catch-all).
+            
+        off_peak_hours - (tuple) of (start hour, end hour) e.g. (22, 6).
+            Outside of this window nothing is refreshed.
+            
+        Returns the number of emails refreshed.
+        """
+        policy = (self._freshness if self._freshness is not None else FreshnessPolicy())
+        if not policy.in_window(off_peak_hours):
+            print("Skipping refresh outside of off-peak hours {}".format(off_peak_hours))
+            return 0
+            
+        self.flush()
+        todo = [r[EMAIL] for r in self.db.fetch_many('refresh_queue.select', (clean_type, budget))]
+        
+        cutoffs = {status: policy.cutoff(status) for status in statuses}
+        cutoffs = {status: cutoff for status, cutoff in cutoffs.items() if cutoff is not None}
+        if len(todo) < budget and cutoffs:
+            oldest = pd.DataFrame(columns=[EMAIL, 'updatedate'])
+            for chunk in self.backend.scan(clean_type=clean_type):
+                chunk = chunk.loc[chunk[EMAIL_STATUS].isin(list(cutoffs)), [EMAIL, EMAIL_STATUS, 'updatedate']]
+                cutoff = chunk[EMAIL_STATUS].map(cutoffs)
+                chunk = chunk[chunk['updatedate'].isnull() | (chunk['updatedate'] < cutoff)]
+                if not chunk.empty:
+                    oldest = pd.concat([oldest, chunk[[EMAIL, 'updatedate']]], ignore_index=True)
+                    oldest = oldest.sort_values('updatedate', na_position='first', kind='stable').head(budget)
+            queued = set(todo)
+            todo.extend([e for e in oldest[EMAIL] if e not in queued])
+            
+        todo = todo[:budget]
+        records = self.backend.get_many(todo)
+        refreshed = 0
+        for email in todo:
+            dealno = records.get(email, {}).get('dealno', None)
+            resp = self._fetch(email, clean_type=clean_type)
+            self._handle_response(email, resp, dealno=(dealno if dealno is not None else 0), clean_type=clean_type)
+            if resp.get(ERROR_CODE, None):
+                continue # Stays queued for the next run.
+            self._execute_write('refresh_queue.delete', (email,))
+            self.backend.commit()
+            self.db.con.commit()
+            refreshed += 1
+        print("Refreshed {} stale records".format(refreshed))
+        return refreshed
             
     def db_clean_one(self, email, clean_type=1):
         """Cleans an email address by checking the local database (and thats it) 
@@ -240,32 +584,98 @@ class ListWise:
         if not pd.notnull(email) or not email:
             return email
             
-        resp = self._quick_clean(email)
+        key = self.cache_key(email)
+        resp = self._fetch(key, clean_type=0)
         #print("{}: {}".format(resp['email'],resp['email_status']))
+        return self._restore_email(email, self._handle_response(key, resp, dealno=dealno, clean_type=0))
+        
+    def _handle_response(self, email, resp, dealno=0, clean_type=1):
+        """
+        Stores an API response in the database under email (the cache key) 
+        and returns the valid email address (or '' if invalid). Errored responses are
+        kept in self._errored_responses and the email is returned as-is.
+        """
         error = resp.get(ERROR_CODE, None)
         if error:
             self._errored_responses.update({email:resp})
+            self._metrics['api_errors'] += 1
             return email
             
-        self._insert_response(resp,dealno=dealno,clean_type=0)
+        self._insert_response(resp, dealno=dealno, clean_type=clean_type, key=email)
         
-        return self._parse_valid_response(email,resp)
+        return self._parse_valid_response(email, resp)
             
     def quick_clean_one2(self, email, dealno=0):
         resp = self.check_db(email, clean_type=0)
         try:
-            return resp[EMAIL]
+            return self._restore_email(email, resp[EMAIL])
         except:
             return self.quick_clean_one(email,dealno=dealno)
         
-    def quick_clean_frame(self, df, email_col=None, clean_col='EMAIL_CLEANED', dealno=0):
+    def quick_clean_frame(self, df, email_col=None, clean_col='EMAIL_CLEANED', dealno=0, workers=1):
         email_col = (EMAIL if not email_col else email_col)
         clean_col = (email_col if not clean_col else clean_col)
 
-        df.loc[:,clean_col] = df.loc[:,email_col].apply(self.parse_email).apply(self.quick_clean_one2,args=([dealno]))
+        df.loc[:,clean_col] = self.clean_series(df.loc[:,email_col], clean_type=0, dealno=dealno, workers=workers)
+        self.flush()
+        self.backend.commit()
         self.db.con.commit()
         return df
         
+    def clean_series(self, emails, clean_type=1, dealno=0, workers=1, cache_only=False):
+        """
+        Parses and cleans a pandas.Series of email addresses.
+        Each unique cache key (see cache_key) is checked against the database once,
+        the misses are sent to the deep (clean_type=1) or quick (clean_type=0) API.
+        
+        PARAMETERS:
+        ============
+        emails - pandas.Series of email addresses
+        
+        clean_type - (int) 1 = deep clean, 0 = quick clean
+        
+        dealno - (int) Defaults to 0, the deal number stored with new responses.
+        
+        workers - (int) Defaults to 1, the number of threads making API calls.
+            Responses are written to the database by the calling thread.
+            
+        cache_only - (bool) Defaults to False, True never calls the API 
+            and returns None for emails missing from the database.
+            
+        Returns a pandas.Series of cleaned emails with the same index.
+        """
+        parsed = emails.apply(self.parse_email)
+        keys = {email:self.cache_key(email) for email in parsed.unique() if email}
+        unique = list(dict.fromkeys(keys.values()))
+        self._metrics['canonical_merged'] += len(keys) - len(unique)
+        verdicts = {}
+        misses = []
+        records = self._get_many(unique)
+        for key in unique:
+            resp = self._cached_verdict(key, records.get(key, None), clean_type=clean_type)
+            if resp:
+                self._metrics['cache_hits'] += 1
+                verdicts[key] = resp[EMAIL]
+            else:
+                self._metrics['cache_misses'] += 1
+                misses.append(key)
+                
+        if cache_only:
+            verdicts.update({key:None for key in misses})
+        elif workers > 1 and len(misses) > 1:
+            with ThreadPoolExecutor(workers) as pool:
+                responses = pool.map(lambda e: self._fetch(e, clean_type=clean_type), misses)
+                for key, resp in zip(misses, responses):
+                    verdicts[key] = self._handle_response(key, resp, dealno=dealno, clean_type=clean_type)
+        else:
+            for key in misses:
+                resp = self._fetch(key, clean_type=clean_type)
+                verdicts[key] = self._handle_response(key, resp, dealno=dealno, clean_type=clean_type)
+                
+        results = {'': ''}
+        results.update({email:self._restore_email(email, verdicts[key]) for email, key in keys.items()})
+        return parsed.map(results)
+        
     def deep_clean_one(self, email, dealno=0):
         """ 
         Checks the email against the deep clean API and inserts the response into the database.
@@ -273,17 +683,10 @@ class ListWise:
         """
         if not pd.notnull(email) or not email:
             return email
-        resp = self._deep_clean(email)
+        key = self.cache_key(email)
+        resp = self._fetch(key, clean_type=1)
         #print("{}: {}".format(resp['email'],resp['email_status']))
-        error = resp.get(ERROR_CODE,None)
-        
-        if error:
-            self._errored_responses.update({email:resp})
-            return email
-            
-        self._insert_response(resp, dealno=dealno, clean_type=1)
-        
-        return self._parse_valid_response(email, resp)
+        return self._restore_email(email, self._handle_response(key, resp, dealno=dealno, clean_type=1))
         
     def deep_clean_one2(self, email, dealno=0):
         """ 
@@ -293,13 +696,13 @@ class ListWise:
         """
         resp = self.check_db(email, clean_type=1)
         try:
-            return resp[EMAIL]
+            return self._restore_email(email, resp[EMAIL])
         except:
             return self.deep_clean_one(email, dealno=dealno)
             
-    def deep_clean_frame(self, df, email_col=None, clean_col='EMAIL_CLEANED', dealno=0):
+    def deep_clean_frame(self, df, email_col=None, clean_col='EMAIL_CLEANED', dealno=0, workers=1):
         """
-        Cleans a pandas.DataFrame using the deep_clean_one2 class method. 
+        Cleans a pandas.DataFrame using the clean_series class method. 
         Cleaned emails are stored in the database for future use.
         
         PARAMETERS:
@@ -314,12 +717,16 @@ class ListWise:
             
         dealno - (int) Defaults to 0, optionally store a deal number 
             with each email address cleaned.
+            
+        workers - (int) Defaults to 1, the number of threads calling the API.
         """
         email_col = (EMAIL if not email_col else email_col)
         if not clean_col:
             clean_col = email_col
 
-        df.loc[:,clean_col] = df.loc[:,email_col].apply(self.parse_email).apply(self.deep_clean_one2,args=([dealno]))
+        df.loc[:,clean_col] = self.clean_series(df.loc[:,email_col], clean_type=1, dealno=dealno, workers=workers)
+        self.flush()
+        self.backend.commit()
         self.db.con.commit()
         return df
         
@@ -328,15 +735,14 @@ class ListWise:
         Pulls records that are still in the processing status and reruns them against 
         the deep clean API. New responses are passed back into the database.
         """
-        sql = """SELECT * FROM emails 
-                WHERE email_status = 'processing' 
-                AND clean_type = 1"""
-        df = self.db.read_sql(sql)
+        self.flush()
+        df = self.backend.read_frame(email_status=PROCESSING, clean_type=1)
 
         for i in range(df.index.size):
             rec = df.loc[i, :]
             self.deep_clean_one(rec[EMAIL], dealno=rec['dealno'])
-        self.db.con.commit()
+        self.flush()
+        self.backend.commit()
         print('Reprocessed {} records that were stuck in the processing status'.format(df.index.size))
         
     def deep_processing_rerun(self, dealno=0, thresh=0.05, max_tries=5):
@@ -344,19 +750,13 @@ class ListWise:
         or until the count of unprocessed records is less than thresh. """
         
         assert thresh < 1 and thresh > 0, "The threshold parameter should be a decimal less than 1 and greater than 0."
-        self.db.cur.execute("SELECT count(*) as count FROM emails WHERE dealno = {}".format(dealno))
-        count = self.db.cur.fetchone()['count']
-        thresh = thresh * count
-        sql = """SELECT * FROM emails 
-                WHERE dealno = {} 
-                AND email_status = 'processing'
-              """.format(dealno)
-        df_processing = self.db.read_sql(sql)
+        summary = self.deal_summary(dealno)
+        thresh = thresh * sum(summary.values())
+        ct = summary.get(PROCESSING, 0)
         
         tries = 0
-        while df_processing.index.size > 0:
+        while ct > 0:
             tries += 1
-            ct = df_processing.index.size
             if tries > max_tries:
                 raise Exception("Tried to reprocess {}x with no luck...giving up.".format(max_tries))
             if tries > 1:
@@ -365,52 +765,120 @@ class ListWise:
             if tries > 2 and ct < thresh:
                 break
                 
-            if ct > 0:
-                print("Reprocessing {} records for deal {}".format(ct,dealno))
-            else:
-                return print("Found no records to reprocess")
-            df_processing = self.db.read_sql(sql)
+            print("Reprocessing {} records for deal {}".format(ct,dealno))
+            df_processing = self.backend.read_frame(dealno=dealno, email_status=PROCESSING)
             self.deep_clean_frame(df_processing, email_col=EMAIL,clean_col=None,dealno=dealno)
+            ct = self.deal_summary(dealno).get(PROCESSING, 0)
         print("Deep processing rerun completed successfully on deal {}".format(dealno))
             
+    def deal_summary(self, dealno, clean_type=None):
+        """
+        Returns {email_status: number of records} for a deal (and clean_type).
+        The default SQLite backend reads these from the trigger-maintained 
+        deal_status_counts table rather than scanning the emails table.
+        """
+        self.flush()
+        return self.backend.deal_summary(dealno, clean_type=clean_type)
+        
+    @property
+    def node_id(self):
+        """The random id identifying this database in sync delta files. """
+        return sync.node_id(self.db)
+        
+    def sync_watermark(self, node_id):
+        """The last change sequence number imported from node_id - export from there next time. """
+        return sync.peer_watermark(self.db, node_id)
+        
+    def _sync_db(self):
+        assert isinstance(self.backend, SQLiteBackend) and self.backend.db is self.db, \
+            "Syncing needs the default SQLite backend."
+        self.flush()
+        self.backend.commit()
+        return self.db
+        
+    def export_changes(self, path, since=0):
+        """
+        Exports the verdicts changed since a change sequence number to a 
+        delta file another node can merge with import_changes (see listwise.sync).
+        Returns the number of records exported.
+        """
+        return sync.export_changes(self._sync_db(), path, since=since)
+        
+    def import_changes(self, path):
+        """
+        Merges a delta file exported by another node. Deep verdicts beat quick 
+        ones, then the newest wins. Returns the number of records inserted/replaced.
+        """
+        return sync.import_changes(self._sync_db(), path)
+        
+    def email_index(self):
+        """
+        Returns an EmailSnapshot of every email in the backend, 
+        rebuilt only when backend.version() says the records may have changed.
+        Used by the merge/suppress/count methods to match emails by hash.
+        """
+        self.flush()
+        version = self.backend.version()
+        if self._email_index is None or version != self._email_index_version:
+            self._email_index = EmailSnapshot.from_frames(self.backend.scan())
+            self._email_index_version = version
+        return self._email_index
+        
+    def _lookup_statuses(self, parsed, clean_type=None):
+        """Returns snapshot status codes for a pandas.Series of parsed emails."""
+        if self._canonicalizer is not None:
+            parsed = parsed.map(self.cache_key)
+        return self.email_index().lookup_hashes(hash_emails(parsed.values), clean_type=clean_type)
+        
+    def merge_email_mask(self, emails):
+        """
+        Returns a numpy boolean array, True for the emails (pandas.Series) 
+        whose parsed address has a clean/catch-all status in the database.
+        """
+        parsed = emails.apply(self.parse_email)
+        codes = self._lookup_statuses(parsed)
+        return np.isin(codes, CLEAN_CODES) & (parsed != '').values
+        
+    def suppress_email_mask(self, emails, clean_type=1):
+        """
+        Returns a numpy boolean array, False for the emails (pandas.Series) 
+        that are blank or have a bad status for clean_type in the database.
+        """
+        parsed = emails.apply(self.parse_email)
+        codes = self._lookup_statuses(parsed, clean_type=clean_type)
+        return ((codes == 0) | np.isin(codes, CLEAN_CODES)) & (parsed != '').values
+        
     def merge_email_frame(self, df, col=None, sql=None):
         """Merges a pandas.DataFrame with clean emails matching from the database. 
-        As this database grows, this operation will take longer to select & join... 
-        we need to just suppress the bad ones."""
-        sql = ("SELECT email,email_status from emails WHERE email_status IN('clean','catch-all')" 
-                if not sql else sql)
+        Emails are matched by hash against email_index() unless a custom sql 
+        query is given, in which case its results are joined with pandas.merge."""
         col = (EMAIL if not col else col)
-        clean_df = self.db.read_sql(sql)
-        clean_df.rename(columns={EMAIL:col}, inplace=True)
-
         df.loc[:,col] = df.loc[:,col].apply(self.parse_email)
         df = df.dropna(subset=[col])
-        df = pd.merge(df, clean_df, how='inner', left_on=col, right_on=col)
-        return df[df[col] != '']
+        if sql:
+            clean_df = self.db.read_sql(sql)
+            clean_df.rename(columns={EMAIL:col}, inplace=True)
+            df = pd.merge(df, clean_df, how='inner', left_on=col, right_on=col)
+            return df[df[col] != '']
+            
+        codes = self._lookup_statuses(df[col])
+        mask = np.isin(codes, CLEAN_CODES) & (df[col] != '').values
+        df = df[mask].copy()
+        df.loc[:,EMAIL_STATUS] = [STATUS_NAMES[c] for c in codes[mask]]
+        return df
         
     def suppress_email_frame(self, df, col='EMAIL', clean_type=1):
         """The opposite of deep_email_merge class method.
-        Bad emails are pulled from the database and suppressed from the original data."""
+        Bad emails are looked up (by hash) in the database and suppressed from the original data."""
         assert clean_type in (0,1), "Invalid clean_type {}, must be 0 or 1."
-        sql = """
-            SELECT email,email_status from emails 
-            WHERE email_id NOT IN
-                (SELECT email_id 
-                FROM emails 
-                WHERE email_status IN('clean','catch-all'))
-            AND clean_type = {}
-            """.format(clean_type)
-        bad_df = self.db.read_sql(sql)
-        bad_df.rename(columns={EMAIL:col},inplace=True)
-
         df.loc[:,col] = df.loc[:,col].apply(self.parse_email)
         df = df.dropna(subset=[col])
         
-        df2 = pd.merge(df, bad_df, how='left', left_on=col, right_on=col)
-        statuses = [x for x in df2.loc[:,'email_status'].unique() if pd.notnull(x)]
-        df2 = df2[~df2.email_status.isin(statuses)]
+        codes = self._lookup_statuses(df[col], clean_type=clean_type)
+        df = df[(codes == 0) | np.isin(codes, CLEAN_CODES)].copy()
+        df.loc[:,EMAIL_STATUS] = np.nan # Kept for compatibility with the old merge-based output.
         
-        return self.drop_missing_emails(df2,col=col)
+        return self.drop_missing_emails(df,col=col)
         
     def drop_missing_emails(self, df, col=None):
         """
@@ -447,15 +915,9 @@ class ListWise:
             the max percentage of missing emails allowed to not raise an error.
         """
         col = (EMAIL if not col else col)
-        TABLE = "rdsupp_temp"
-        idx = "rdsupp_index"
         df.loc[:,col] = df.loc[:,col].apply(self.parse_email)
         df = self.drop_missing_emails(df,col=col)
-        df_check = self.drop_missing_emails(df.loc[:,col],col=col)
-        df_check.to_sql(TABLE,self.db.con,index_label=idx,if_exists='replace')
-        sql = "SELECT COUNT(*) as count FROM {t1} WHERE {col} IN (SELECT email FROM emails)".format(t1=TABLE,col=col)
-        self.db.cur.execute(sql)
-        count_matching = self.db.cur.fetchone()['count']
+        count_matching = int((self._lookup_statuses(df[col]) != 0).sum())
         if verify_integrity:
             assert thresh < 1 and thresh > 0, "The thresh parameter should be a decimal less than 1 and greater than 0."
             count_orig = df.index.size
@@ -471,7 +933,8 @@ class ListWise:
     def process_domains(self, save_path=None):
         """Gathers unique domain names from the database.
         imports new domain names to the domains table."""
-        emails = self.db.read_sql("SELECT * FROM emails")
+        self.flush()
+        emails = self.backend.read_frame()
         emails.loc[:, email2] = emails.loc[:, email].apply(self.parse_email)            
         emails.loc[:, DOMAIN] = emails.loc[:, email2].apply(self.get_domain)
         emails.drop_duplicates([DOMAIN], inplace=True)
@@ -479,6 +942,31 @@ class ListWise:
             emails.to_csv(save_path, index=False)
         emails.loc[:,DOMAIN].to_sql(DOMAINS, self.db.con, if_exists='append', index=False)
         
+    def snapshot_key(self):
+        """
+        Returns the metadata describing how export_snapshot keys emails 
+        (see listwise.snapshot.key_function): parsed, then canonicalized 
+        with this instance's canonicalizer rules when one is set.
+        """
+        key = {'parse': True}
+        if self._canonicalizer is not None:
+            key['canonicalizer'] = self._canonicalizer.config()
+        return key
+        
+    def export_snapshot(self, path):
+        """
+        Compiles the emails table into a listwise.snapshot.EmailSnapshot file 
+        (sorted hashes of parsed emails with their status) that read-only 
+        consumers can memory-map with EmailSnapshot.load(path) 
+        instead of querying the database. Returns the number of records.
+        The key metadata is saved next to it (path + '.json') so the 
+        loaded snapshot parses lookups the same way suppress_email_mask does.
+        """
+        self.flush()
+        snap = EmailSnapshot.from_frames(self.backend.scan(), key=self.snapshot_key())
+        snap.save(path)
+        return len(snap)
+        
     def _reparse_database_emails(self):
         """ 
         Run this after updating ListWised.parse_emails 
@@ -486,7 +974,8 @@ class ListWise:
         and rerun changed emails through ListWised.
         Deletes the old email addresses from the database.
         """
-        emails = self.db.read_sql("SELECT * FROM emails")
+        self.flush()
+        emails = self.backend.read_frame()
         emails.loc[:, email2] = emails.loc[:, email].apply(self.parse_email)
         diff_emails = emails.loc[emails[email2] != emails[email], [email, email2, 'dealno']]
         
@@ -501,16 +990,17 @@ class ListWise:
                     r = diff_emails.iloc[i]
                     self.deep_clean_one(r[email2], r['dealno'])
                     self.delete_email(r[email])
-                self.db.con.commit()
+                self.backend.commit()
                 self.deep_processing_rerun_all()
                 print("Re-parse processing complete.")
             except:
-                self.db.con.rollback()
+                self.backend.rollback()
                 raise
         else:
             print("No new database email records found to re-process.")       
 
-    def process_multiple_files(self, filepaths, email_col='EMAIL',min_size=100, threshold=0.05):
+    def process_multiple_files(self, filepaths, email_col='EMAIL',min_size=100, threshold=0.05,
+                               output_format=None, batch_size=fileio.DEFAULT_BATCH_SIZE, max_memory=None):
         """
         Processes multiple filepaths
         runs the email addresses against the ListWise API - deep clean.
@@ -518,6 +1008,10 @@ class ListWise:
         uploads cleaned up files to DropBox.
         Notifies art at the end with all new filenames
         
+        Files can be CSV, Parquet (.parquet/.pq) or Arrow (.arrow/.feather). 
+        Only the email column is read for cleaning, the remaining columns are 
+        streamed from the (memory-mapped) source into the output in batches.
+        
         PARAMETERS:
         ========================
         lw: A ListWise object
@@ -525,13 +1019,17 @@ class ListWise:
         email_col: (string) - the column in each file that contains the email addresses to process.
         min_size: (int) - the minimum # of email addresses that must exist in the file in order to process it.
         threshold: (float) - a float representing a min percentage of processed records to gather before exporting the data.
+        output_format: (string) - 'csv', 'parquet' or 'arrow', defaults to the format of each input file.
+        batch_size: (int) - the number of rows streamed into the output at a time.
+        max_memory: (int) - optional max bytes for de-duplicating each file's emails (see pre_process_frame).
         
         Returns (list) containing the new filepaths of the processed files.
         """
         new_paths = []
         for f in filepaths:
-            df = pd.read_csv(f)
-            df = self.pre_process_frame(df, col=email_col)
+            df = fileio.read_column(f, email_col).to_frame()
+            df = self.pre_process_frame(df, col=email_col, max_memory=max_memory)
+            parsed = df[email_col].copy() # The cleaner may change addresses (typos), the source rows are matched by these.
             orig_size = df.index.size
             FLAG = True
             if orig_size < min_size:
@@ -544,11 +1042,12 @@ class ListWise:
                 except Exception as e:
                     
                     print("{}\n Calling missing emails from remote server.".format(e))
-                    df = self.deep_clean_frame(df,dealno=0,clean_col=email_col) # The long way - calling the API.
+                    df = self.deep_clean_frame(df,email_col=email_col,dealno=0,clean_col=email_col) # The long way - calling the API.
                     
                     try:
                         self.deep_processing_rerun(dealno=0,thresh=0.05,max_tries=5) # Handling records stuck in processing.
-                        count = self.count_matching_emails(df, col=email_col, verify_integrity=True, thresh=threshold)
+                        # Verdicts are stored under the addresses sent, not the ones the API returned.
+                        count = self.count_matching_emails(parsed.to_frame(), col=email_col, verify_integrity=True, thresh=threshold)
                         print("Successfully matched {} records".format(count))
                     except Exception as e:
                         
@@ -557,12 +1056,32 @@ class ListWise:
                         
                 if FLAG:
                     df = self.suppress_email_frame(df, col=email_col, clean_type=1)
-                    new_path = os.path.splitext(f) + "ListWised.csv"
-                    df.to_csv(new_path, index=False)
+                    new_path = fileio.output_path(f, fmt=output_format)
+                    keep = dict(zip(parsed.loc[df.index], df[email_col]))
+                    self._write_suppressed_file(f, new_path, email_col, keep,
+                                                batch_size=batch_size, fmt=output_format)
                     new_paths.append(new_path)
                     
         self.deep_processing_rerun_all() # Wraps up making one last try at rerunning any emails stuck in processing (for next time).
+        self.flush()
         return new_paths
+        
+    def _write_suppressed_file(self, src, dest, col, keep, batch_size=fileio.DEFAULT_BATCH_SIZE, fmt=None):
+        """
+        Streams src into dest keeping the first row of each parsed email in keep,
+        a dictionary of {parsed email: cleaned email}. The email column is 
+        written cleaned, matching the suppressed frame.
+        Returns the number of rows written.
+        """
+        def select(emails):
+            parsed = emails.apply(self.parse_email)
+            mask = (parsed.isin(keep) & ~parsed.duplicated()).values
+            cleaned = parsed.map(lambda e: keep.get(e, e))
+            for e in parsed[mask]:
+                del keep[e] # Later duplicates are dropped.
+            return mask, cleaned
+        
+        return fileio.stream_filter(src, dest, col, select, batch_size=batch_size, fmt=fmt)
     
 def test_merge_vs_suppress_email_frame(lw, filepath):
     opath = os.path.splitext(filepath)[0] + '-LWMERGED.csv'
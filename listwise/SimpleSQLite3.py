@@ -7,14 +7,34 @@ Created on Thu Oct 27 11:17:23 2016
 import sqlite3 
 import pandas as pd
 
+# The number of compiled statements sqlite3 keeps per connection (its default is 128).
+DEFAULT_CACHED_STATEMENTS = 256
+
+def quote_identifier(name):
+    """Quotes a table/column name for use in SQL. """
+    return '"{}"'.format(str(name).replace('"', '""'))
+
 class SimpleSQLite3:
     """ 
     A simplified sqlite3 class with a connection & cursor.
     Interacts with Pandas.
+    
+    Statements registered with prepare(name, sql) can be run by name 
+    with parameters. sqlite3 caches compiled statements by their SQL 
+    text, so reusing one parameterized statement skips re-compiling it 
+    (up to cached_statements distinct statements per connection).
+    
+    Pass check_same_thread=False to share the connection between threads.
+    execute/executemany/fetch_* use a cursor per call so concurrent 
+    callers don't share cursor state (SQLite serializes the connection).
     """
-    def __init__(self, database_path):
+    def __init__(self, database_path, cached_statements=DEFAULT_CACHED_STATEMENTS, check_same_thread=True):
         self._database_path = database_path
-        self._con = sqlite3.connect(self._database_path)
+        self._cached_statements = cached_statements
+        self._check_same_thread = check_same_thread
+        self._statements = {}
+        self._con = sqlite3.connect(self._database_path, cached_statements=cached_statements,
+                                    check_same_thread=check_same_thread)
         self._cur = self._con.cursor()
     
     @property
@@ -32,7 +52,8 @@ class SimpleSQLite3:
         return sqlite3.Row
     
     def _connect(self, dbpath):
-        self._con = sqlite3.connect(dbpath)
+        self._con = sqlite3.connect(dbpath, cached_statements=self._cached_statements,
+                                    check_same_thread=self._check_same_thread)
         self.DBPath = dbpath
         self._cur = self.con.cursor()
 
@@ -40,13 +61,45 @@ class SimpleSQLite3:
         self.con.row_factory = row_factory
         self._cur = self.con.cursor()
 
+    def prepare(self, name, sql):
+        """Registers a parameterized statement to be run by name. """
+        self._statements[name] = sql
+        
+    def statement(self, name_or_sql):
+        """Returns the SQL of a prepared statement (or the SQL given). """
+        return self._statements.get(name_or_sql, name_or_sql)
+        
+    def execute(self, name_or_sql, params=()):
+        """Executes a prepared statement (by name) or SQL with parameters on a new cursor, returns the cursor. """
+        return self.con.cursor().execute(self.statement(name_or_sql), params)
+        
+    def executemany(self, name_or_sql, seq_of_params):
+        return self.con.cursor().executemany(self.statement(name_or_sql), seq_of_params)
+        
+    def fetch_one(self, name_or_sql, params=()):
+        """Returns the first row of a query (or None) without going through pandas. """
+        return self.execute(name_or_sql, params).fetchone()
+        
+    def fetch_many(self, name_or_sql, params=(), size=None):
+        """Returns a list of rows (all of them or the first size rows) without going through pandas. """
+        cur = self.execute(name_or_sql, params)
+        if size is None:
+            return cur.fetchall()
+        return cur.fetchmany(size)
+        
+    def fetch_value(self, name_or_sql, params=()):
+        """Returns the first column of the first row of a query (or None). """
+        row = self.fetch_one(name_or_sql, params)
+        if row is None:
+            return None
+        return row[0]
+
     def show_tables(self):
         show_tables_query = "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"  
-        return self.liteQuery(show_tables_query)
+        return [row[0] for row in self.fetch_many(show_tables_query)]
         
     def count_records(self, tablename):
-        self.cur.execute("SELECT COUNT(*) FROM {}".format(tablename))
-        return self.cur.fetchone()[0]
+        return self.fetch_value("SELECT COUNT(*) FROM {}".format(quote_identifier(tablename)))
         
     def add_column(self,table,column,dtype):
         sql = "ALTER TABLE {} ADD COLUMN {} {}".format(table,column,dtype)
@@ -57,27 +110,26 @@ class SimpleSQLite3:
         self.cur.execute("DROP TABLE {}".format(table_name))
 
     def get_columns(self, table):
-        df = self.read_sql("SELECT * FROM {} LIMIT 1".format(table))
-        return df.columns.tolist()
+        return [row[1] for row in self.fetch_many("PRAGMA table_info({})".format(quote_identifier(table)))]
         
     def count_columns(self, table):
         return len(self.get_columns(table))
         
     def sql_exists(self, table_name, fields=None):
         """
-        Makes a small query testing if the
-        table exists in the database
-        or if the fields exist in the table.
-        Returns True if no errors, False otherwise.
+        Checks sqlite_master to see if the
+        table (or view) exists in the database
+        and if the fields exist in the table.
+        Returns True if they do, False otherwise.
         """
         assert not fields or isinstance(fields, list), "fields must be a list or None, not {}".format(type(fields))
-        try:
-            df = self.read_sql("SELECT * FROM {} LIMIT 1".format(table_name))
-            if fields:
-                df = df.loc[:, fields]
-            return True
-        except Exception:
+        sql = "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ? COLLATE NOCASE"
+        if self.fetch_one(sql, (table_name,)) is None:
             return False
+        if fields:
+            columns = set(c.lower() for c in self.get_columns(table_name))
+            return all(f.lower() in columns for f in fields)
+        return True
             
     def get_table(self, table, **kwargs):
         return self.read_sql("SELECT * FROM {}".format(table), **kwargs)
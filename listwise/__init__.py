@@ -4,8 +4,41 @@ Created on Thu Oct 27 12:26:13 2016
 
 @author: zbarge
 """
-
-from .ListWise import ListWise, InvalidCredentialsError
-from .SimpleSQLite3 import SimpleSQLite3
+import sys
+import types
+import importlib
 
 __version__ = "1.0.4"
+
+# {name: submodule} of the package's exports. They're imported on first use 
+# so `python -m listwise --help` doesn't wait for pandas.
+_EXPORTS = {'ListWise': 'ListWise',
+            'InvalidCredentialsError': 'ListWise',
+            'SimpleSQLite3': 'SimpleSQLite3',
+            'RateLimiter': 'ratelimit',
+            'TokenBucket': 'ratelimit',
+            'CacheBackend': 'backends',
+            'SQLiteBackend': 'backends',
+            'MemoryBackend': 'backends',
+            'DbmBackend': 'backends'}
+
+__all__ = list(_EXPORTS)
+
+
+class _Package(types.ModuleType):
+    def __getattr__(self, name):
+        if name not in _EXPORTS:
+            raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+        value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        # Importing the ListWise & SimpleSQLite3 submodules binds them to the package,
+        # keep the classes of the same name there instead (as the eager imports did).
+        if isinstance(value, types.ModuleType) and _EXPORTS.get(name, None) == name:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
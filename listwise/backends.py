@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""Storage backends for the email verdict cache used by ListWise.
+
+Every backend stores records - dictionaries with the RECORD_FIELDS keys -
+keyed by email address and implements get_many/put_many/delete/scan.
+    SQLiteBackend - the emails table of a SimpleSQLite3 database (the default).
+    MemoryBackend - a dictionary, for tests & benchmarks.
+    DbmBackend    - a stdlib dbm file with JSON encoded records.
+"""
+import json
+import dbm
+import shutil
+import tempfile
+import os
+from datetime import datetime
+from time import perf_counter
+import pandas as pd
+from .freshness import DATETIME_FORMAT
+
+RECORD_FIELDS = ('email', 'email_status', 'free_mail', 'typo_fixed',
+                 'dealno', 'clean_type', 'insertdate', 'updatedate')
+
+DEFAULT_CHUNKSIZE = 500000
+
+# SQLite limits the number of ? parameters in one statement.
+SQLITE_MAX_PARAMS = 500
+
+# get_many pads IN (...) lists up to one of these sizes so only a 
+# handful of distinct statements end up in the statement cache.
+LOOKUP_BATCH_SIZES = (1, 8, 64, SQLITE_MAX_PARAMS)
+
+
+def _now():
+    return datetime.now().strftime(DATETIME_FORMAT)
+
+
+def make_record(resp, dealno=0, clean_type=0):
+    """Builds a record from a ListWise API response dictionary."""
+    return {'email': resp['email'],
+            'email_status': resp['email_status'],
+            'free_mail': resp.get('free_mail', None),
+            'typo_fixed': resp.get('typo_fixed', None),
+            'dealno': int(dealno),
+            'clean_type': int(clean_type)}
+
+
+def _matches(record, filters):
+    return all(record.get(k, None) == v for k, v in filters.items())
+
+
+def _frames(records, chunksize):
+    """Groups an iterable of records into pandas.DataFrames of chunksize rows."""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunksize:
+            yield pd.DataFrame(chunk, columns=RECORD_FIELDS)
+            chunk = []
+    if chunk:
+        yield pd.DataFrame(chunk, columns=RECORD_FIELDS)
+
+
+class CacheBackend:
+    """
+    The interface ListWise uses to store verdicts.
+    Subclasses implement get_many, put_many, delete and scan.
+    """
+    def get_many(self, emails):
+        """Returns {email: record} for the emails that are stored."""
+        raise NotImplementedError
+
+    def put_many(self, records):
+        """
+        Inserts or updates records. insertdate is kept for existing
+        emails and updatedate is set to the current local time.
+        """
+        raise NotImplementedError
+
+    def delete(self, emails):
+        raise NotImplementedError
+
+    def scan(self, chunksize=DEFAULT_CHUNKSIZE, **filters):
+        """
+        Yields pandas.DataFrames (RECORD_FIELDS columns) of every record,
+        optionally only those where record[field] == value for each filter.
+        Records are yielded oldest update first where the backend can.
+        """
+        raise NotImplementedError
+
+    def get(self, email):
+        return self.get_many([email]).get(email, None)
+
+    def read_frame(self, **filters):
+        """Returns every (filtered) record as one pandas.DataFrame."""
+        frames = list(self.scan(**filters))
+        if not frames:
+            return pd.DataFrame(columns=RECORD_FIELDS)
+        return pd.concat(frames, ignore_index=True)
+
+    def count(self, **filters):
+        return sum(len(f) for f in self.scan(**filters))
+
+    def deal_summary(self, dealno, clean_type=None):
+        """Returns {email_status: number of records} for a dealno (and clean_type)."""
+        filters = {'dealno': dealno}
+        if clean_type is not None:
+            filters['clean_type'] = clean_type
+        counts = {}
+        for chunk in self.scan(**filters):
+            for status, n in chunk['email_status'].fillna('').value_counts().items():
+                counts[status] = counts.get(status, 0) + int(n)
+        return counts
+
+    def version(self):
+        """A value that changes whenever the stored records may have changed."""
+        raise NotImplementedError
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Stores records in the emails table of a SimpleSQLite3 database.
+    Lookups, upserts & deletes are prepared statements on the database 
+    (named '<table>.get.<batch size>', '<table>.put' & '<table>.delete').
+    
+    summary_table names a table of (dealno, clean_type, email_status, records)
+    counts kept current by triggers on table, used by deal_summary when it exists.
+    """
+    def __init__(self, db, table='emails', summary_table=None):
+        self.db = db
+        self.table = table
+        self.summary_table = summary_table
+        fields = ",".join(RECORD_FIELDS)
+        for size in LOOKUP_BATCH_SIZES:
+            db.prepare(self._name('get', size), "SELECT {} FROM {} WHERE email IN ({})".format(
+                fields, table, ",".join("?" * size)))
+        db.prepare(self._name('put'), """INSERT INTO {} (email,email_status,free_mail,typo_fixed,dealno,clean_type)
+                VALUES (?,?,?,?,?,?)
+                ON CONFLICT(email) DO UPDATE SET
+                    email_status = excluded.email_status,
+                    free_mail = excluded.free_mail,
+                    typo_fixed = excluded.typo_fixed,
+                    dealno = excluded.dealno,
+                    clean_type = excluded.clean_type,
+                    updatedate = DATETIME('now', 'localtime');""".format(table))
+        db.prepare(self._name('delete'), "DELETE FROM {} WHERE email = ?".format(table))
+
+    def _name(self, *parts):
+        return ".".join([self.table] + [str(p) for p in parts])
+
+    def get_many(self, emails):
+        emails = list(emails)
+        found = {}
+        for i in range(0, len(emails), SQLITE_MAX_PARAMS):
+            batch = emails[i:i + SQLITE_MAX_PARAMS]
+            size = next(s for s in LOOKUP_BATCH_SIZES if s >= len(batch))
+            batch = batch + batch[-1:] * (size - len(batch))
+            for row in self.db.fetch_many(self._name('get', size), batch):
+                found[row[0]] = dict(zip(RECORD_FIELDS, row))
+        return found
+
+    def put_many(self, records):
+        self.db.executemany(self._name('put'), [(r['email'], r['email_status'], r.get('free_mail', None),
+                                                 r.get('typo_fixed', None), r.get('dealno', 0), r.get('clean_type', 0))
+                                                for r in records])
+
+    def delete(self, emails):
+        self.db.executemany(self._name('delete'), [(e,) for e in emails])
+
+    def scan(self, chunksize=DEFAULT_CHUNKSIZE, **filters):
+        where = ""
+        params = [filters[k] for k in sorted(filters)]
+        if filters:
+            where = "WHERE " + " AND ".join("{} = ?".format(k) for k in sorted(filters))
+        sql = "SELECT {} FROM {} {} ORDER BY updatedate, email_id".format(",".join(RECORD_FIELDS), self.table, where)
+        for chunk in self.db.read_sql(sql, params=params, chunksize=chunksize):
+            yield chunk
+
+    def count(self, **filters):
+        where = ""
+        if filters:
+            where = "WHERE " + " AND ".join("{} = ?".format(k) for k in sorted(filters))
+        return self.db.fetch_value("SELECT COUNT(*) FROM {} {}".format(self.table, where),
+                                   [filters[k] for k in sorted(filters)])
+
+    def deal_summary(self, dealno, clean_type=None):
+        if not self.summary_table or not self.db.sql_exists(self.summary_table):
+            return CacheBackend.deal_summary(self, dealno, clean_type=clean_type)
+        sql = "SELECT email_status, SUM(records) FROM {} WHERE dealno = ?".format(self.summary_table)
+        params = [dealno]
+        if clean_type is not None:
+            sql += " AND clean_type = ?"
+            params.append(clean_type)
+        sql += " GROUP BY email_status HAVING SUM(records) > 0"
+        return {status: int(n) for status, n in self.db.fetch_many(sql, params)}
+
+    def version(self):
+        return (self.db.fetch_value("PRAGMA data_version"), self.db.con.total_changes)
+
+    def commit(self):
+        self.db.con.commit()
+
+    def rollback(self):
+        self.db.con.rollback()
+
+
+class MemoryBackend(CacheBackend):
+    """Keeps records in a dictionary - nothing is persisted."""
+    def __init__(self):
+        self._records = {}
+        self._version = 0
+
+    def get_many(self, emails):
+        found = {}
+        for email in emails:
+            record = self._records.get(email, None)
+            if record is not None:
+                found[email] = dict(record)
+        return found
+
+    def put_many(self, records):
+        now = _now()
+        for r in records:
+            old = self._records.pop(r['email'], None) # Re-inserting keeps oldest update first.
+            record = {k: r.get(k, None) for k in RECORD_FIELDS}
+            record['insertdate'] = (old['insertdate'] if old else now)
+            record['updatedate'] = now
+            self._records[r['email']] = record
+        self._version += 1
+
+    def delete(self, emails):
+        for email in emails:
+            self._records.pop(email, None)
+        self._version += 1
+
+    def scan(self, chunksize=DEFAULT_CHUNKSIZE, **filters):
+        records = (r for r in list(self._records.values()) if _matches(r, filters))
+        return _frames(records, chunksize)
+
+    def version(self):
+        return self._version
+
+
+class DbmBackend(CacheBackend):
+    """
+    Stores JSON encoded records in a stdlib dbm file (dbm.gnu, dbm.ndbm
+    or dbm.dumb - whichever dbm.open picks). Scans are in key order
+    rather than update order. version() only sees this process's writes.
+    """
+    def __init__(self, path, flag='c'):
+        self.path = path
+        self._db = dbm.open(path, flag)
+        self._version = 0
+
+    def get_many(self, emails):
+        found = {}
+        for email in emails:
+            value = self._db.get(email.encode('utf-8'), None)
+            if value is not None:
+                found[email] = json.loads(value.decode('utf-8'))
+        return found
+
+    def put_many(self, records):
+        now = _now()
+        for r in records:
+            key = r['email'].encode('utf-8')
+            old = self._db.get(key, None)
+            record = {k: r.get(k, None) for k in RECORD_FIELDS}
+            record['insertdate'] = (json.loads(old.decode('utf-8'))['insertdate'] if old is not None else now)
+            record['updatedate'] = now
+            self._db[key] = json.dumps(record).encode('utf-8')
+        self._version += 1
+
+    def delete(self, emails):
+        for email in emails:
+            key = email.encode('utf-8')
+            if key in self._db:
+                del self._db[key]
+        self._version += 1
+
+    def _records(self, filters):
+        for key in self._db.keys():
+            record = json.loads(self._db[key].decode('utf-8'))
+            if _matches(record, filters):
+                yield record
+
+    def scan(self, chunksize=DEFAULT_CHUNKSIZE, **filters):
+        return _frames(self._records(filters), chunksize)
+
+    def version(self):
+        return self._version
+
+    def commit(self):
+        sync = getattr(self._db, 'sync', None)
+        if sync is not None:
+            sync()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def benchmark_backend(backend, n=10000, bulk_size=1000, single_lookups=1000):
+    """
+    Times a backend filled with n records.
+
+    Returns a dictionary of:
+        put_per_record_us - bulk insert time per record
+        single_lookup_us  - mean latency of get_many([email])
+        bulk_lookup_us    - bulk_size emails per get_many call, time per email
+        miss_lookup_us    - mean latency of looking up an unknown email
+    """
+    emails = ["user{}@example{}.com".format(i, i % 97) for i in range(n)]
+    records = [{'email': e, 'email_status': 'clean', 'free_mail': 'no', 'typo_fixed': 'no',
+                'dealno': 0, 'clean_type': 1} for e in emails]
+    start = perf_counter()
+    for i in range(0, n, bulk_size):
+        backend.put_many(records[i:i + bulk_size])
+    backend.commit()
+    put = perf_counter() - start
+
+    step = max(1, n // single_lookups)
+    sample = emails[::step][:single_lookups]
+    start = perf_counter()
+    for email in sample:
+        backend.get_many([email])
+    single = perf_counter() - start
+
+    start = perf_counter()
+    for i in range(0, n, bulk_size):
+        backend.get_many(emails[i:i + bulk_size])
+    bulk = perf_counter() - start
+
+    start = perf_counter()
+    for i in range(len(sample)):
+        backend.get_many(["missing{}@example.com".format(i)])
+    miss = perf_counter() - start
+
+    return {'put_per_record_us': put / n * 1e6,
+            'single_lookup_us': single / len(sample) * 1e6,
+            'bulk_lookup_us': bulk / n * 1e6,
+            'miss_lookup_us': miss / len(sample) * 1e6}
+
+
+def benchmark_all(n=10000, bulk_size=1000, directory=None):
+    """Benchmarks each backend in a temporary directory, returns {backend name: results}."""
+    from .ListWise import ListWise
+    tmp = tempfile.mkdtemp(prefix='listwise-bench-', dir=directory)
+    try:
+        lw = ListWise(os.path.join(tmp, 'listwise.db'), test_credentials=False)
+        backends = [('sqlite', lw.backend),
+                    ('memory', MemoryBackend()),
+                    ('dbm', DbmBackend(os.path.join(tmp, 'listwise.dbm')))]
+        results = {}
+        for name, backend in backends:
+            results[name] = benchmark_backend(backend, n=n, bulk_size=bulk_size)
+            backend.close()
+        del lw
+        return results
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Provider-aware canonical forms of (already parsed) email addresses.
+Addresses that reach the same mailbox share one canonical form so they
+share one cached (and billed) verdict.
+"""
+
+# Per-domain rules:
+#   ignore_dots - dots in the local part are ignored by the provider.
+#   plus_tags   - everything after a '+' in the local part is a tag.
+#   alias       - the domain is another name for this domain.
+DEFAULT_PROVIDER_RULES = {
+    'gmail.com': {'ignore_dots': True, 'plus_tags': True},
+    'googlemail.com': {'ignore_dots': True, 'plus_tags': True, 'alias': 'gmail.com'},
+    'outlook.com': {'plus_tags': True},
+    'hotmail.com': {'plus_tags': True},
+    'live.com': {'plus_tags': True},
+    'msn.com': {'plus_tags': True},
+    'icloud.com': {'plus_tags': True},
+    'me.com': {'plus_tags': True},
+    'mac.com': {'plus_tags': True},
+    'fastmail.com': {'plus_tags': True},
+    'protonmail.com': {'plus_tags': True},
+    'proton.me': {'plus_tags': True},
+}
+
+# Common misspellings of big provider domains.
+DEFAULT_DOMAIN_TYPOS = {
+    'gmial.com': 'gmail.com',
+    'gmai.com': 'gmail.com',
+    'gamil.com': 'gmail.com',
+    'gnail.com': 'gmail.com',
+    'gmaill.com': 'gmail.com',
+    'gmail.co': 'gmail.com',
+    'gmail.cm': 'gmail.com',
+    'gmail.con': 'gmail.com',
+    'hotmial.com': 'hotmail.com',
+    'hotmal.com': 'hotmail.com',
+    'hotmail.co': 'hotmail.com',
+    'hotmail.con': 'hotmail.com',
+    'yaho.com': 'yahoo.com',
+    'yahooo.com': 'yahoo.com',
+    'yahoo.con': 'yahoo.com',
+    'outlok.com': 'outlook.com',
+    'outlook.co': 'outlook.com',
+    'aol.con': 'aol.com',
+    'iclod.com': 'icloud.com',
+}
+
+
+class Canonicalizer:
+    """
+    Maps parsed email addresses to canonical cache keys.
+
+    Canonicalizer().canonicalize('john.doe+promo@googlemail.com') -> 'johndoe@gmail.com'
+    Canonicalizer().repair('john.doe+promo@gmial.com') -> 'john.doe+promo@gmail.com'
+
+    PARAMETERS:
+    ============
+    rules - (dict) of {domain: rule dict}, merged over DEFAULT_PROVIDER_RULES.
+        A value of None removes the default rule for that domain.
+
+    typos - (dict) of {misspelled domain: domain}, merged over DEFAULT_DOMAIN_TYPOS.
+
+    repair_typos - (bool) Defaults to True, False leaves domains as they are.
+    """
+    def __init__(self, rules=None, typos=None, repair_typos=True):
+        self.rules = dict(DEFAULT_PROVIDER_RULES)
+        self.typos = dict(DEFAULT_DOMAIN_TYPOS)
+        if rules:
+            self.rules.update(rules)
+        if typos:
+            self.typos.update(typos)
+        self.rules = {d: r for d, r in self.rules.items() if r is not None}
+        self.repair_typos = repair_typos
+
+    def config(self):
+        """
+        Returns the keyword arguments that rebuild this Canonicalizer
+        (JSON serializable, e.g. for snapshot metadata).
+        """
+        removed = {d: None for d in DEFAULT_PROVIDER_RULES if d not in self.rules}
+        return {'rules': dict(self.rules, **removed),
+                'typos': dict(self.typos),
+                'repair_typos': self.repair_typos}
+
+    def _split(self, email):
+        if not email or '@' not in email:
+            return None, None
+        local, domain = email.rsplit('@', 1)
+        if self.repair_typos:
+            domain = self.typos.get(domain, domain)
+        return local, domain
+
+    def repair(self, email):
+        """Returns the email with a misspelled domain fixed (and nothing else changed)."""
+        local, domain = self._split(email)
+        if local is None:
+            return email
+        return local + '@' + domain
+
+    def canonicalize(self, email):
+        """Returns the canonical form of a parsed email address."""
+        local, domain = self._split(email)
+        if local is None:
+            return email
+        rule = self.rules.get(domain, None)
+        if rule:
+            if rule.get('plus_tags', False):
+                local = local.split('+')[0]
+            if rule.get('ignore_dots', False):
+                local = local.replace('.', '')
+            domain = rule.get('alias', domain)
+            if not local:
+                return email
+        return local + '@' + domain
+
+    __call__ = canonicalize
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Record/replay transports for the ListWise API so load runs & tests can
+work offline and reproducibly.
+
+A cassette is a JSON lines file, one request per line:
+    {"url":"https://api.listwisehq.com/clean/deep.php?email=tony%40yahoo.com",
+     "status":200,"body":{...},"elapsed":0.7312}
+The api_key is stripped from every stored url. body is the decoded JSON
+response (or null with the raw "text" when the response wasn't JSON).
+
+    lw = ListWise(path, api_key=key, transport=RecordingTransport('run.jsonl'))
+    lw = ListWise(path, transport=ReplayTransport('run.jsonl', speed=10))
+"""
+import json
+import threading
+from collections import deque
+from time import sleep, perf_counter
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+
+RECORD = 'record'
+REPLAY = 'replay'
+CASSETTE_MODES = (RECORD, REPLAY)
+
+SECRET_PARAMS = ('api_key',)
+
+
+class CassetteMissError(Exception): pass
+
+
+def strip_secrets(url):
+    """Returns the url without its api_key query parameter."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+class CassetteResponse:
+    """A replayed response with the parts of requests.Response ListWise uses."""
+    def __init__(self, status_code, body=None, text=None):
+        self.status_code = status_code
+        self.body = body
+        self.text = (text if text is not None else json.dumps(body))
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("The recorded response was not JSON: {}".format(self.text[:100]))
+        return self.body
+
+
+class RecordingTransport:
+    """
+    Makes real requests through transport (requests by default) and appends
+    each request/response pair with its latency to the cassette at path.
+
+    PARAMETERS:
+    ============
+    path - (string) the cassette file, appended to if it exists.
+
+    transport - an object with get(url) returning a response with 
+        status_code, text & json(), defaults to the requests module.
+    """
+    def __init__(self, path, transport=requests, clock=perf_counter):
+        self.path = path
+        self._transport = transport
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._fh = open(path, 'a', encoding='utf-8')
+        self.recorded = 0
+
+    def get(self, url):
+        start = self._clock()
+        r = self._transport.get(url)
+        elapsed = self._clock() - start
+        entry = {'url': strip_secrets(url), 'status': r.status_code}
+        try:
+            entry['body'] = r.json()
+        except ValueError:
+            entry['body'] = None
+            entry['text'] = r.text
+        entry['elapsed'] = round(elapsed, 4)
+        line = json.dumps(entry, separators=(',', ':'))
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            self.recorded += 1
+        return r
+
+    def close(self):
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ReplayTransport:
+    """
+    Serves the responses recorded in a cassette without touching the network.
+
+    Responses to the same url are replayed in the order they were recorded,
+    the last one repeats once they run out. A url that was never recorded 
+    raises a CassetteMissError.
+
+    PARAMETERS:
+    ============
+    path - (string) the cassette file.
+
+    speed - (float) 1 replays the recorded latencies in real-time, 
+        10 replays them 10x faster. None or 0 (the default) replays instantly.
+    """
+    def __init__(self, path, speed=None, sleeper=sleep):
+        self.path = path
+        self.speed = speed
+        self._sleep = sleeper
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.replayed = 0
+        with open(path, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry['url'], deque()).append(entry)
+
+    def __len__(self):
+        return sum(len(e) for e in self._entries.values())
+
+    def get(self, url):
+        key = strip_secrets(url)
+        with self._lock:
+            entries = self._entries.get(key, None)
+            if not entries:
+                raise CassetteMissError("No recorded response for {} in {}".format(key, self.path))
+            entry = (entries.popleft() if len(entries) > 1 else entries[0])
+            self.replayed += 1
+        if self.speed:
+            self._sleep(entry.get('elapsed', 0) / float(self.speed))
+        return CassetteResponse(entry['status'], entry.get('body', None), entry.get('text', None))
+
+    def close(self):
+        pass
+
+
+def cassette_transport(path, mode=REPLAY, speed=None):
+    """Returns a RecordingTransport or ReplayTransport for path."""
+    assert mode in CASSETTE_MODES, "mode must be one of {}, not {}".format(CASSETTE_MODES, mode)
+    if mode == RECORD:
+        return RecordingTransport(path)
+    return ReplayTransport(path, speed=speed)
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""The listwise command line tool.
+
+    listwise --db listwise.db clean list.csv -o list-clean.csv --workers 8
+    cat list.csv | listwise --db listwise.db suppress > list-suppressed.csv
+    listwise --db listwise.db --metrics count list.parquet
+    listwise --record run.jsonl clean list.csv -o list-clean.csv
+    listwise --replay run.jsonl --replay-speed 10 --metrics clean list.csv -o list-clean.csv
+
+Input defaults to stdin & output to stdout (CSV). Files ending in .parquet
+or .arrow are read/written with pyarrow. Data is processed batch by batch.
+Credentials default to the LISTWISE_USERNAME & LISTWISE_API_KEY environment variables.
+"""
+import os
+import sys
+import argparse
+from time import time
+
+# The command modules (pandas, pyarrow...) are imported in run() after the 
+# arguments are parsed so --help & usage errors return quickly.
+STDIO = '-'
+EMAIL = 'email' # ListWise.EMAIL
+DEFAULT_BATCH_SIZE = 100000 # fileio.DEFAULT_BATCH_SIZE
+
+
+def _add_io_arguments(parser, output=True):
+    parser.add_argument('input', nargs='?', default=STDIO,
+                        help="CSV, Parquet or Arrow file to read (default: stdin as CSV)")
+    if output:
+        parser.add_argument('-o', '--output', default=STDIO,
+                            help="file to write, the format follows the extension (default: stdout as CSV)")
+    parser.add_argument('-c', '--email-col', default=EMAIL,
+                        help="the column containing email addresses (default: %(default)s)")
+    parser.add_argument('-b', '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help="rows read & processed at a time (default: %(default)s)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='listwise', description="ListWise email validation.")
+    parser.add_argument('--db', default=os.environ.get('LISTWISE_DB', 'listwise.db'),
+                        help="path to the sqlite database of responses (default: %(default)s)")
+    parser.add_argument('--username', default=os.environ.get('LISTWISE_USERNAME', None))
+    parser.add_argument('--api-key', default=os.environ.get('LISTWISE_API_KEY', None))
+    parser.add_argument('--rate', type=float, default=None,
+                        help="max API requests per second per endpoint")
+    parser.add_argument('--rate-file', default=None,
+                        help="sqlite file to share the --rate limit between processes")
+    parser.add_argument('--max-age-days', type=float, default=None,
+                        help="treat cached verdicts older than this as expired (overrides the per-status defaults)")
+    parser.add_argument('--serve-stale', action='store_true',
+                        help="use expired verdicts and queue them for the refresh command instead of calling the API")
+    parser.add_argument('--canonicalize', action='store_true',
+                        help="cache & verify provider-canonical addresses (dots/plus tags/domain typos)")
+    parser.add_argument('--metrics', action='store_true',
+                        help="print a metrics summary to stderr when done")
+    parser.add_argument('--write-behind', action='store_true',
+                        help="write API responses to the database from a background thread in batches")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument('--record', default=None, metavar='CASSETTE',
+                          help="append every API request/response to this cassette file")
+    cassette.add_argument('--replay', default=None, metavar='CASSETTE',
+                          help="serve API responses from this cassette file instead of the network")
+    parser.add_argument('--replay-speed', type=float, default=None,
+                        help="replay recorded latencies this many times faster (1 = real-time, default: instant)")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    clean = commands.add_parser('clean', help="clean emails against the database and the API")
+    _add_io_arguments(clean)
+    clean.add_argument('--clean-col', default=None,
+                       help="column to store cleaned emails in (default: replace --email-col)")
+    clean.add_argument('--quick', action='store_true', help="use the quick clean API instead of deep clean")
+    clean.add_argument('--dealno', type=int, default=0)
+    clean.add_argument('-w', '--workers', type=int, default=1, help="threads making API calls (default: %(default)s)")
+    clean.add_argument('--cache-only', action='store_true',
+                       help="never call the API, emails missing from the database come back empty")
+    clean.add_argument('--drop-invalid', action='store_true', help="drop rows without a clean email")
+
+    suppress = commands.add_parser('suppress', help="drop rows with emails known to be bad")
+    _add_io_arguments(suppress)
+    suppress.add_argument('--clean-type', type=int, default=1, choices=(0, 1))
+
+    merge = commands.add_parser('merge', help="keep only rows with emails known to be clean")
+    _add_io_arguments(merge)
+
+    count = commands.add_parser('count', help="count emails that exist in the database")
+    _add_io_arguments(count, output=False)
+
+    rerun = commands.add_parser('rerun-processing', help="rerun emails stuck in the processing status")
+    rerun.add_argument('--dealno', type=int, default=None,
+                       help="only rerun this deal (waits & retries), default reruns everything once")
+    rerun.add_argument('--thresh', type=float, default=0.05)
+    rerun.add_argument('--max-tries', type=int, default=5)
+
+    export = commands.add_parser('sync-export', help="write the verdicts changed since a sequence number to a delta file")
+    export.add_argument('output', help="the delta file to write (gzipped JSON lines)")
+    since = export.add_mutually_exclusive_group()
+    since.add_argument('--since', type=int, default=0, help="change sequence number to export after (default: everything)")
+    since.add_argument('--peer-db', default=None,
+                       help="export what the node with this database hasn't imported from us yet")
+
+    merge_delta = commands.add_parser('sync-import', help="merge delta files exported by other nodes")
+    merge_delta.add_argument('inputs', nargs='+', help="delta files")
+
+    summary = commands.add_parser('summary', help="print the record count per email_status of a deal")
+    summary.add_argument('dealno', type=int)
+    summary.add_argument('--clean-type', type=int, default=None, choices=(0, 1))
+
+    snapshot = commands.add_parser('snapshot', help="export a memory-mappable snapshot of the emails table")
+    snapshot.add_argument('output', help="the .npy file to write")
+
+    bench = commands.add_parser('benchmark', help="time single & bulk lookups for each cache backend")
+    bench.add_argument('--rows', type=int, default=10000, help="records per backend (default: %(default)s)")
+
+    refresh = commands.add_parser('refresh', help="re-verify queued & expired verdicts within an API budget")
+    refresh.add_argument('--budget', type=int, default=100, help="max API calls (default: %(default)s)")
+    refresh.add_argument('--quick', action='store_true', help="refresh quick clean verdicts instead of deep")
+    refresh.add_argument('--off-peak', default=None, metavar='START-END',
+                         help="only run between these hours, e.g. 22-6")
+    return parser
+
+
+def _read_batches(path, batch_size):
+    import pandas as pd
+    from . import fileio
+    if path == STDIO:
+        return pd.read_csv(sys.stdin, chunksize=batch_size)
+    return fileio.iter_batches(path, batch_size=batch_size)
+
+
+def _to_pandas(batch):
+    import pandas as pd
+    if isinstance(batch, pd.DataFrame):
+        return batch
+    return batch.to_pandas()
+
+
+class _StdoutWriter:
+    """Writes CSV batches to stdout with a single header."""
+    def __init__(self):
+        self.rows = 0
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(sys.stdout, index=False, header=self._header)
+        self._header = False
+        self.rows += len(df)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        sys.stdout.flush()
+
+
+def _open_writer(path):
+    if path == STDIO:
+        return _StdoutWriter()
+    from . import fileio
+    return fileio.FrameWriter(path)
+
+
+def _clean_batch(lw, df, args):
+    clean_col = (args.clean_col if args.clean_col else args.email_col)
+    df.loc[:, clean_col] = lw.clean_series(df.loc[:, args.email_col], clean_type=(0 if args.quick else 1),
+                                           dealno=args.dealno, workers=args.workers,
+                                           cache_only=args.cache_only)
+    lw.backend.commit()
+    lw.db.con.commit()
+    if args.drop_invalid:
+        df = lw.drop_missing_emails(df, col=clean_col)
+    return df
+
+
+def _transform(lw, args, func):
+    """Streams args.input through func(lw, df, args) into args.output."""
+    stats = {'rows_in': 0, 'rows_out': 0}
+    with _open_writer(args.output) as writer:
+        for batch in _read_batches(args.input, args.batch_size):
+            df = _to_pandas(batch)
+            stats['rows_in'] += len(df)
+            df = func(lw, df, args)
+            stats['rows_out'] += len(df)
+            writer.write(df)
+    return stats
+
+
+def run(args):
+    """Runs a parsed command and returns a dictionary of stats."""
+    if args.command == 'benchmark':
+        import pandas as pd
+        from .backends import benchmark_all
+        results = benchmark_all(n=args.rows)
+        print(pd.DataFrame(results).T.round(2).to_string())
+        return {}
+
+    from .ListWise import ListWise
+    from .ratelimit import RateLimiter
+    from .freshness import FreshnessPolicy
+    from .canonical import Canonicalizer
+    from .cassette import RecordingTransport, ReplayTransport
+
+    limiter = None
+    if args.rate:
+        limiter = RateLimiter(default_rate=args.rate, path=args.rate_file)
+    freshness = None
+    if args.max_age_days is not None or args.serve_stale:
+        freshness = FreshnessPolicy(serve_stale=args.serve_stale)
+        if args.max_age_days is not None:
+            freshness.max_age_days = {}
+            freshness.default_max_age = args.max_age_days
+    transport = None
+    if args.record:
+        transport = RecordingTransport(args.record)
+    elif args.replay:
+        transport = ReplayTransport(args.replay, speed=args.replay_speed)
+    lw = ListWise(args.db, username=args.username, api_key=args.api_key,
+                  test_credentials=False, rate_limiter=limiter, freshness=freshness,
+                  canonicalizer=(Canonicalizer() if args.canonicalize else None),
+                  transport=transport, write_behind=args.write_behind)
+
+    if args.command == 'clean':
+        stats = _transform(lw, args, _clean_batch)
+    elif args.command == 'suppress':
+        stats = _transform(lw, args, lambda lw, df, args: lw.suppress_email_frame(
+            df, col=args.email_col, clean_type=args.clean_type))
+    elif args.command == 'merge':
+        stats = _transform(lw, args, lambda lw, df, args: lw.merge_email_frame(df, col=args.email_col))
+    elif args.command == 'count':
+        stats = {'rows_in': 0, 'matching': 0}
+        for batch in _read_batches(args.input, args.batch_size):
+            df = _to_pandas(batch)
+            stats['rows_in'] += len(df)
+            stats['matching'] += lw.count_matching_emails(df, col=args.email_col, verify_integrity=False)
+        print(stats['matching'])
+    elif args.command == 'rerun-processing':
+        if args.dealno is None:
+            lw.deep_processing_rerun_all()
+        else:
+            lw.deep_processing_rerun(dealno=args.dealno, thresh=args.thresh, max_tries=args.max_tries)
+        stats = {}
+    elif args.command == 'sync-export':
+        since = args.since
+        if args.peer_db:
+            since = ListWise(args.peer_db, test_credentials=False).sync_watermark(lw.node_id)
+        stats = {'exported': lw.export_changes(args.output, since=since), 'since': since}
+    elif args.command == 'sync-import':
+        stats = {'imported': sum(lw.import_changes(path) for path in args.inputs)}
+    elif args.command == 'summary':
+        stats = lw.deal_summary(args.dealno, clean_type=args.clean_type)
+        for status in sorted(stats):
+            print("{}: {}".format(status, stats[status]))
+        stats = {'records': sum(stats.values())}
+    elif args.command == 'snapshot':
+        stats = {'records': lw.export_snapshot(args.output)}
+    elif args.command == 'refresh':
+        hours = None
+        if args.off_peak:
+            hours = tuple(int(h) for h in args.off_peak.split('-'))
+        stats = {'refreshed': lw.refresh_stale(budget=args.budget, clean_type=(0 if args.quick else 1),
+                                               off_peak_hours=hours)}
+
+    lw.close()
+    stats.update(lw.metrics)
+    if transport is not None:
+        transport.close()
+    return stats
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    start = time()
+    stats = run(args)
+    if args.metrics:
+        elapsed = time() - start
+        stats['seconds'] = round(elapsed, 3)
+        if stats.get('rows_in', 0) and elapsed > 0:
+            stats['rows_per_second'] = round(stats['rows_in'] / elapsed, 1)
+        for key in sorted(stats):
+            sys.stderr.write("{}: {}\n".format(key, stats[key]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Out-of-core de-duplication. Values are hash-partitioned into spill
+files on disk and each partition is de-duplicated on its own, so the
+hash table never holds more than one partition. Partitions that are
+still too big are re-partitioned on the next 8 bits of the hash.
+The result is exactly pandas.Series.duplicated(keep='first').
+"""
+import os
+import math
+import pickle
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from .snapshot import hash_emails
+
+# Rough bytes used per email by a pandas hash table (string + object + table slot).
+BYTES_PER_VALUE = 160
+
+DEFAULT_CHUNKSIZE = 500000
+
+# Spill files open at once per level - 8 bits of the hash each.
+MAX_PARTITIONS = 256
+MAX_LEVELS = 8
+
+
+def partitions_for(rows, max_memory):
+    """Returns the number of partitions needed to dedup rows within max_memory bytes."""
+    return max(1, int(math.ceil(rows * BYTES_PER_VALUE / float(max_memory))))
+
+
+class ExternalDeduper:
+    """
+    Finds duplicate values across chunks that don't fit in memory together.
+
+    with ExternalDeduper(n_partitions=64) as dd:
+        for chunk in chunks:
+            dd.add(chunk)
+        dupes = dd.duplicated()   # numpy boolean array over every value added
+
+    PARAMETERS:
+    ============
+    n_partitions - (int) the number of spill files (at most MAX_PARTITIONS), 
+        peak memory is roughly the size of the largest partition.
+
+    spill_dir - (string) the directory to create the spill files in,
+        defaults to the system temp directory.
+
+    max_memory - (int) optional max bytes per partition, bigger partitions
+        are re-partitioned on the next bits of the hash (up to MAX_LEVELS deep).
+
+    level - (int) which 8 bits of the hash pick the partition.
+    """
+    def __init__(self, n_partitions=64, spill_dir=None, max_memory=None, level=0):
+        assert 0 < n_partitions <= MAX_PARTITIONS, \
+            "n_partitions must be between 1 and {}, not {}".format(MAX_PARTITIONS, n_partitions)
+        self.n_partitions = n_partitions
+        self.max_memory = max_memory
+        self.level = level
+        self.spill_dir = spill_dir
+        self.rows = 0
+        self._sizes = np.zeros(n_partitions, dtype=np.int64)
+        self._files = []
+        self._dir = tempfile.mkdtemp(prefix='listwise-dedup-', dir=spill_dir)
+        try:
+            for i in range(n_partitions):
+                self._files.append(open(os.path.join(self._dir, "{}.pkl".format(i)), 'wb'))
+        except:
+            self.close()
+            raise
+
+    def add(self, values):
+        """Spills a chunk of values (positions continue from the previous chunk)."""
+        values = np.asarray(values, dtype=object)
+        positions = np.arange(self.rows, self.rows + values.size, dtype=np.int64)
+        self.rows += values.size
+        if not values.size:
+            return
+        keys = pd.Series(values).fillna('').values
+        hashes = hash_emails(keys) >> np.uint64(8 * self.level)
+        parts = hashes % np.uint64(self.n_partitions)
+        for p in np.unique(parts):
+            selected = parts == p
+            self._sizes[int(p)] += int(selected.sum())
+            pickle.dump((positions[selected], values[selected]), self._files[int(p)],
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _iter_partition(self, i):
+        """Yields the (positions, values) chunks spilled to partition i."""
+        with open(os.path.join(self._dir, "{}.pkl".format(i)), 'rb') as fh:
+            while True:
+                try:
+                    yield pickle.load(fh)
+                except EOFError:
+                    break
+
+    def _too_big(self, i):
+        return (self.max_memory is not None and self.level + 1 < MAX_LEVELS
+                and self._sizes[i] * BYTES_PER_VALUE > self.max_memory)
+
+    def _partition_duplicated(self, i):
+        """Returns (positions, duplicated mask) of partition i."""
+        if self._too_big(i):
+            n = min(MAX_PARTITIONS, partitions_for(self._sizes[i], self.max_memory))
+            positions = []
+            with ExternalDeduper(n_partitions=max(n, 2), spill_dir=self.spill_dir,
+                                 max_memory=self.max_memory, level=self.level + 1) as child:
+                for pos, vals in self._iter_partition(i):
+                    positions.append(pos)
+                    child.add(vals)
+                return np.concatenate(positions), child.duplicated()
+
+        positions, values = [], []
+        for pos, vals in self._iter_partition(i):
+            positions.append(pos)
+            values.append(vals)
+        values = pd.Series(np.concatenate(values), dtype=object)
+        return np.concatenate(positions), values.duplicated(keep='first').values
+
+    def duplicated(self):
+        """
+        Returns a numpy boolean array (one per value added) that is True
+        for every value already seen at an earlier position.
+        """
+        for fh in self._files:
+            fh.flush()
+        dupes = np.zeros(self.rows, dtype=bool)
+        for i in range(self.n_partitions):
+            if not self._sizes[i]:
+                continue
+            # Chunks were added in order so positions within a partition are ascending.
+            positions, mask = self._partition_duplicated(i)
+            dupes[positions[mask]] = True
+        return dupes
+
+    def close(self):
+        for fh in self._files:
+            fh.close()
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def duplicated(values, max_memory=None, spill_dir=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Same as pandas.Series(values).duplicated(keep='first') returned as a
+    numpy array, but keeps the hash table under roughly max_memory bytes by
+    spilling hash partitions to disk (at most MAX_PARTITIONS files open at 
+    a time per level). Without max_memory (or when everything fits) the 
+    in-memory pandas path is used.
+    """
+    values = np.asarray(values, dtype=object)
+    n_partitions = (partitions_for(values.size, max_memory) if max_memory else 1)
+    if n_partitions == 1:
+        return pd.Series(values, dtype=object).duplicated(keep='first').values
+
+    with ExternalDeduper(n_partitions=min(n_partitions, MAX_PARTITIONS), spill_dir=spill_dir,
+                         max_memory=max_memory) as dd:
+        for i in range(0, values.size, chunksize):
+            dd.add(values[i:i + chunksize])
+        return dd.duplicated()
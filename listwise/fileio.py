@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Reads and writes the files processed by ListWise.process_multiple_files.
+CSV is handled by pandas, Parquet & Arrow (Feather v2/IPC) files need pyarrow.
+Columnar files are memory-mapped and only the requested columns are read.
+"""
+import os
+import pandas as pd
+
+CSV = 'csv'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+
+FILE_FORMATS = {'.csv': CSV,
+                '.txt': CSV,
+                '.parquet': PARQUET,
+                '.pq': PARQUET,
+                '.arrow': ARROW,
+                '.feather': ARROW,
+                '.ipc': ARROW}
+
+FORMAT_EXTENSIONS = {CSV: '.csv', PARQUET: '.parquet', ARROW: '.arrow'}
+
+DEFAULT_BATCH_SIZE = 100000
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("Parquet/Arrow files require pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def file_format(path):
+    """Returns CSV, PARQUET or ARROW based on the file extension (defaults to CSV)."""
+    return FILE_FORMATS.get(os.path.splitext(path)[1].lower(), CSV)
+
+
+def output_path(path, suffix='-LISTWISED', fmt=None):
+    """
+    Returns path with suffix added before the extension.
+    When fmt is given the extension is changed to match it.
+    """
+    root, ext = os.path.splitext(path)
+    if fmt:
+        ext = FORMAT_EXTENSIONS[fmt]
+    return root + suffix + ext
+
+
+def read_frame(path, columns=None):
+    """Reads a whole file (or just the given columns) into a pandas.DataFrame."""
+    fmt = file_format(path)
+    if fmt == CSV:
+        return pd.read_csv(path, usecols=columns)
+    pa = _pyarrow()
+    if fmt == PARQUET:
+        table = pa.parquet.read_table(path, columns=columns, memory_map=True)
+    else:
+        with pa.memory_map(path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns:
+            table = table.select(columns)
+    return table.to_pandas()
+
+
+def read_column(path, column):
+    """Reads a single column of a file as a pandas.Series."""
+    return read_frame(path, columns=[column])[column]
+
+
+def iter_batches(path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields the file in batches of roughly batch_size rows.
+    CSV files yield pandas.DataFrames, Parquet/Arrow files
+    yield pyarrow.Tables read from a memory map.
+    """
+    fmt = file_format(path)
+    if fmt == CSV:
+        for chunk in pd.read_csv(path, chunksize=batch_size):
+            yield chunk
+        return
+    pa = _pyarrow()
+    if fmt == PARQUET:
+        pf = pa.parquet.ParquetFile(path, memory_map=True)
+        for batch in pf.iter_batches(batch_size=batch_size):
+            yield pa.Table.from_batches([batch])
+    else:
+        with pa.memory_map(path, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield pa.Table.from_batches([reader.get_batch(i)])
+
+
+class FrameWriter:
+    """
+    Writes batches (pandas.DataFrames or pyarrow.Tables)
+    to a CSV, Parquet or Arrow file one at a time.
+
+    with FrameWriter(path) as writer:
+        for batch in batches:
+            writer.write(batch)
+    """
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = (fmt if fmt else file_format(path))
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._header = True
+
+    def write(self, batch):
+        if self.fmt == CSV:
+            if not isinstance(batch, pd.DataFrame):
+                batch = batch.to_pandas()
+            batch.to_csv(self.path, index=False, header=self._header, mode=('w' if self._header else 'a'))
+            self._header = False
+        else:
+            pa = _pyarrow()
+            if isinstance(batch, pd.DataFrame):
+                batch = pa.Table.from_pandas(batch, preserve_index=False)
+            if self._writer is None:
+                self._schema = batch.schema
+                if self.fmt == PARQUET:
+                    self._writer = pa.parquet.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            self._writer.write_table(batch.cast(self._schema))
+        self.rows += len(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        elif self._header and self.fmt == CSV:
+            # Nothing was written - leave an empty file behind like to_csv would.
+            open(self.path, 'w').close()
+            self._header = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def filter_batch(batch, col, func):
+    """
+    Applies func(pandas.Series of emails) -> (boolean mask, pandas.Series of new emails)
+    to a batch and returns the batch with masked rows kept and the
+    email column replaced with the new values.
+    """
+    if isinstance(batch, pd.DataFrame):
+        mask, values = func(batch[col])
+        batch = batch.loc[mask].copy()
+        batch.loc[:, col] = values[mask].values
+        return batch
+
+    pa = _pyarrow()
+    mask, values = func(batch.column(col).to_pandas())
+    batch = batch.filter(pa.array(mask, type=pa.bool_()))
+    idx = batch.schema.get_field_index(col)
+    return batch.set_column(idx, pa.field(col, pa.string()),
+                            pa.array(values[mask].tolist(), type=pa.string()))
+
+
+def stream_filter(src, dest, col, func, batch_size=DEFAULT_BATCH_SIZE, fmt=None):
+    """
+    Streams every column of src into dest batch by batch,
+    keeping rows selected by func (see filter_batch).
+    Returns the number of rows written.
+    """
+    with FrameWriter(dest, fmt=fmt) as writer:
+        for batch in iter_batches(src, batch_size=batch_size):
+            writer.write(filter_batch(batch, col, func))
+    return writer.rows
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+# The format SQLite's DATETIME('now', 'localtime') writes to insertdate/updatedate.
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Default max age (in days) of a cached verdict by email_status.
+# Statuses not listed here use FreshnessPolicy.default_max_age.
+DEFAULT_MAX_AGE_DAYS = {'clean': 180,
+                        'catch-all': 90,
+                        'processing': 1,
+                        'unknown': 30,
+                        'bad-mx': 90,
+                        'bounced': 365,
+                        'invalid': 365,
+                        'no-reply': 365,
+                        'spam-trap': 365,
+                        'suspicious': 90}
+
+
+def parse_datetime(value):
+    """Parses an insertdate/updatedate value, returns None if it can't."""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(str(value)[:19], DATETIME_FORMAT)
+    except ValueError:
+        return None
+
+
+class FreshnessPolicy:
+    """
+    Decides when a cached verdict in the emails table is too old to trust.
+
+    PARAMETERS:
+    ============
+    max_age_days - (dict) of {email_status: max age in days}, merged over
+        DEFAULT_MAX_AGE_DAYS. A value of None means the status never expires.
+
+    default_max_age - (float) max age in days for statuses not in max_age_days.
+
+    serve_stale - (bool) Defaults to False which treats expired entries as
+        cache misses (the API is called again). True returns the expired
+        entry and queues the email for ListWise.refresh_stale instead.
+
+    now - (callable) returning the current local datetime.
+    """
+    def __init__(self, max_age_days=None, default_max_age=365, serve_stale=False, now=datetime.now):
+        self.max_age_days = dict(DEFAULT_MAX_AGE_DAYS)
+        if max_age_days:
+            self.max_age_days.update(max_age_days)
+        self.default_max_age = default_max_age
+        self.serve_stale = serve_stale
+        self.now = now
+
+    def max_age(self, status):
+        """Returns the max age of a status as a timedelta (or None if it never expires)."""
+        days = self.max_age_days.get(status, self.default_max_age)
+        if days is None:
+            return None
+        return timedelta(days=days)
+
+    def cutoff(self, status):
+        """
+        Returns the updatedate string entries with this status
+        must be newer than, or None if the status never expires.
+        """
+        age = self.max_age(status)
+        if age is None:
+            return None
+        return (self.now() - age).strftime(DATETIME_FORMAT)
+
+    def is_stale(self, status, updatedate):
+        """True when a verdict with this status last updated at updatedate has expired."""
+        age = self.max_age(status)
+        if age is None:
+            return False
+        updated = parse_datetime(updatedate)
+        if updated is None:
+            return True
+        return self.now() - updated > age
+
+    def in_window(self, hours):
+        """
+        True if the current hour falls within hours=(start, end),
+        a window that may wrap midnight, e.g. (22, 6). None is always True.
+        """
+        if not hours:
+            return True
+        start, end = hours
+        hour = self.now().hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
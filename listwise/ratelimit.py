@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import threading
+from time import sleep, time
+
+# HTTP statuses that mean the provider wants us to slow down.
+THROTTLE_STATUS_CODES = (429, 502, 503, 504)
+
+# ListWise error codes 1 & 2 are credential problems - backing off won't fix those.
+CREDENTIAL_ERROR_CODES = (1, 2)
+
+BUCKETS_SQL_TABLE = """CREATE TABLE IF NOT EXISTS token_buckets (
+    name    VARCHAR (30) PRIMARY KEY,
+    tokens  REAL,
+    rate    REAL,
+    updated REAL
+);"""
+
+
+class TokenBucket:
+    """
+    A token bucket that refills at an adaptive rate (tokens per second).
+
+    If a path is given the bucket state lives in a small SQLite file so
+    several worker processes on one host draw from the same bucket.
+    Otherwise the state is kept in memory and shared between threads.
+
+    The rate is adjusted additive-increase/multiplicative-decrease style:
+    every throttled response multiplies the rate by backoff_factor
+    (never going below min_rate) and every successful response adds
+    recovery_step back (never going above max_rate).
+    """
+    def __init__(self, rate, capacity=None, min_rate=None, max_rate=None,
+                 backoff_factor=0.5, recovery_step=None, path=None, name='default',
+                 clock=time, sleeper=sleep):
+        assert rate > 0, "rate must be greater than 0, not {}".format(rate)
+        assert 0 < backoff_factor < 1, "backoff_factor should be a decimal less than 1 and greater than 0."
+        self.name = name
+        self.capacity = float(capacity if capacity else max(rate, 1))
+        self.max_rate = float(max_rate if max_rate else rate)
+        self.min_rate = float(min_rate if min_rate else rate / 20.0)
+        self.backoff_factor = backoff_factor
+        self.recovery_step = float(recovery_step if recovery_step else self.max_rate / 20.0)
+        self._path = path
+        self._clock = clock
+        self._sleep = sleeper
+        self._lock = threading.Lock()
+        self._con = None
+        self._state = {'tokens': self.capacity, 'rate': float(rate), 'updated': clock()}
+        if path:
+            self._con = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                        check_same_thread=False)
+            self._con.execute(BUCKETS_SQL_TABLE)
+            self._con.execute("INSERT OR IGNORE INTO token_buckets (name, tokens, rate, updated) VALUES (?,?,?,?)",
+                              (name, self.capacity, float(rate), clock()))
+
+    @property
+    def rate(self):
+        """The current refill rate in tokens per second."""
+        return self._transact(lambda state: None)['rate']
+
+    def _transact(self, func):
+        """
+        Loads the bucket state, refills it, applies func(state)
+        and saves it back - all inside one lock/transaction.
+        Returns the state dictionary.
+        """
+        with self._lock:
+            if self._con is None:
+                state = self._state
+                self._refill(state)
+                func(state)
+                return dict(state)
+
+            cur = self._con.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.execute("SELECT tokens, rate, updated FROM token_buckets WHERE name = ?", (self.name,))
+                tokens, rate, updated = cur.fetchone()
+                state = {'tokens': tokens, 'rate': rate, 'updated': updated}
+                self._refill(state)
+                func(state)
+                cur.execute("UPDATE token_buckets SET tokens = ?, rate = ?, updated = ? WHERE name = ?",
+                            (state['tokens'], state['rate'], state['updated'], self.name))
+                cur.execute("COMMIT")
+            except:
+                cur.execute("ROLLBACK")
+                raise
+            return state
+
+    def _refill(self, state):
+        now = self._clock()
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(self.capacity, state['tokens'] + elapsed * state['rate'])
+        state['updated'] = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Takes tokens from the bucket if they are available.
+        Returns 0 on success, otherwise the number of seconds
+        to wait before enough tokens will be available.
+        """
+        result = {}
+
+        def take(state):
+            if state['tokens'] >= tokens:
+                state['tokens'] -= tokens
+                result['wait'] = 0.0
+            else:
+                result['wait'] = (tokens - state['tokens']) / state['rate']
+
+        self._transact(take)
+        return result['wait']
+
+    def acquire(self, tokens=1):
+        """Blocks until tokens are available and takes them."""
+        wait = self.try_acquire(tokens)
+        while wait > 0:
+            self._sleep(wait)
+            wait = self.try_acquire(tokens)
+
+    def backoff(self):
+        """Multiplicatively reduces the rate after a throttled response."""
+        def slow_down(state):
+            state['rate'] = max(self.min_rate, state['rate'] * self.backoff_factor)
+            state['tokens'] = min(state['tokens'], 0.0)
+        self._transact(slow_down)
+
+    def recover(self):
+        """Additively increases the rate after a successful response."""
+        def speed_up(state):
+            state['rate'] = min(self.max_rate, state['rate'] + self.recovery_step)
+        self._transact(speed_up)
+
+    def close(self):
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+
+class RateLimiter:
+    """
+    Holds one TokenBucket per API endpoint ('deep', 'quick', ...).
+
+    PARAMETERS:
+    ============
+    rates - (dict) of {endpoint: requests per second}. Endpoints
+        not in the dictionary use default_rate.
+
+    path - (string) optional path to a SQLite file used to share
+        the buckets between processes on the same host.
+
+    max_retries - (int) how many times a throttled request should be
+        retried (after waiting on the slowed down bucket) before
+        the throttled response is handed back to the caller.
+
+    **bucket_kwargs - passed on to each TokenBucket
+        (capacity, min_rate, backoff_factor, recovery_step, ...)
+    """
+    def __init__(self, rates=None, default_rate=2.0, path=None, max_retries=3, **bucket_kwargs):
+        self._rates = dict(rates) if rates else {}
+        self._default_rate = default_rate
+        self._path = path
+        self._bucket_kwargs = bucket_kwargs
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.max_retries = max_retries
+
+    def bucket(self, endpoint):
+        """Returns (creating if needed) the TokenBucket for an endpoint."""
+        with self._lock:
+            if endpoint not in self._buckets:
+                rate = self._rates.get(endpoint, self._default_rate)
+                self._buckets[endpoint] = TokenBucket(rate, path=self._path, name=endpoint,
+                                                      **self._bucket_kwargs)
+            return self._buckets[endpoint]
+
+    def acquire(self, endpoint):
+        self.bucket(endpoint).acquire()
+
+    def is_throttled(self, status_code, data):
+        """
+        Returns True when a response indicates throttling:
+        a throttling HTTP status or a ListWise error code
+        that isn't a credentials problem.
+        """
+        if status_code in THROTTLE_STATUS_CODES:
+            return True
+        try:
+            error = data.get('error_code', None)
+        except AttributeError:
+            return False
+        return bool(error) and error not in CREDENTIAL_ERROR_CODES
+
+    def report(self, endpoint, status_code, data=None):
+        """
+        Feeds a response back into the endpoint's bucket.
+        Returns True if the response was throttled.
+        """
+        bucket = self.bucket(endpoint)
+        if self.is_throttled(status_code, data):
+            bucket.backoff()
+            return True
+        bucket.recover()
+        return False
+
+    def close(self):
+        for bucket in self._buckets.values():
+            bucket.close()
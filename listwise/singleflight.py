@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+class _Call:
+    """One in-flight call that other callers can wait on."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces duplicate concurrent calls.
+
+    The first caller for a key runs the function, every caller that
+    arrives with the same key while it is running waits and receives
+    the same result (or exception). Once the call finishes the key is
+    forgotten, so later callers run the function again.
+
+    Counters:
+        calls  - number of times the function was actually run.
+        shared - number of callers that were handed another caller's result
+                 (i.e. the number of calls saved).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key, None)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        """Returns the number of keys currently being processed."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        return {'calls': self.calls, 'shared': self.shared}
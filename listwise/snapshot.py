@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""A read-only snapshot of the emails table for processes that only need
+to know whether an address is known-clean or known-bad.
+
+The snapshot is a single .npy file holding a (2, n) uint64 array:
+    row 0 - sorted 64-bit hashes of the normalized email addresses
+    row 1 - status code | clean_type << 8 for each hash
+It is loaded with numpy.load(mmap_mode='r') so any number of processes
+share the same pages and lookups are binary searches (numpy.searchsorted).
+
+How emails were keyed before hashing is saved beside it as JSON 
+(emails.npy.json) so lookups apply the same steps (see key_function).
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# 0 is reserved for "not in the snapshot".
+STATUS_CODES = {'clean': 1,
+                'catch-all': 2,
+                'processing': 3,
+                'bad-mx': 4,
+                'bounced': 5,
+                'invalid': 6,
+                'no-reply': 7,
+                'spam-trap': 8,
+                'suspicious': 9,
+                'unknown': 10}
+OTHER_STATUS = 255
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+CLEAN_CODES = (STATUS_CODES['clean'], STATUS_CODES['catch-all'])
+
+SNAPSHOT_SQL = "SELECT email, email_status, clean_type FROM emails ORDER BY updatedate, email_id"
+
+
+def normalize_email(email):
+    """The normalization applied to lookups: stripped & lowercased."""
+    return str(email).strip().lower()
+
+
+def key_function(key):
+    """
+    Returns the function mapping an email address to its snapshot key 
+    from a snapshot's key metadata:
+        {'parse': True} - ListWise.parse_email is applied.
+        {'canonicalizer': {...}} - then Canonicalizer(**config).canonicalize.
+    Snapshots without metadata (key=None) use normalize_email.
+    """
+    if not key:
+        return normalize_email
+    steps = []
+    if key.get('parse', False):
+        from .ListWise import parse_email
+        steps.append(parse_email)
+    if key.get('canonicalizer', None) is not None:
+        from .canonical import Canonicalizer
+        steps.append(Canonicalizer(**key['canonicalizer']).canonicalize)
+
+    def to_key(email):
+        for step in steps:
+            email = step(email)
+        return email
+    return to_key
+
+
+def key_path(path):
+    """The path of the key metadata saved next to a snapshot."""
+    return path + '.json'
+
+
+def hash_emails(emails):
+    """
+    Hashes an iterable of (normalized) email addresses to uint64s.
+    Uses pandas' vectorized siphash with its fixed key so hashes are
+    stable between processes & machines.
+    """
+    values = np.asarray(emails, dtype=object)
+    if values.size == 0:
+        return np.empty(0, dtype=np.uint64)
+    return pd.util.hash_array(values)
+
+
+def status_codes(statuses):
+    """Maps email_status strings to snapshot status codes."""
+    return pd.Series(statuses).map(STATUS_CODES).fillna(OTHER_STATUS).astype(np.uint64).values
+
+
+class EmailSnapshot:
+    """
+    Sorted hashes of email addresses with their status code & clean_type.
+
+    EmailSnapshot.from_db(lw.db, key=lw.snapshot_key()).save("emails.npy")
+    snap = EmailSnapshot.load("emails.npy")
+    snap.lookup('Tony@Yahoo.com; x@y.com') -> 'clean'
+    snap.is_bad(df['email']) -> numpy boolean array
+
+    PARAMETERS:
+    ============
+    data - (numpy.ndarray) (2, n) uint64 array of sorted hashes and codes.
+
+    key - (dict, default None) key metadata describing how emails were 
+        keyed before hashing. Lookups apply key_function(key) by default.
+    """
+    def __init__(self, data, key=None):
+        assert data.ndim == 2 and data.shape[0] == 2, "Expected a (2, n) array of hashes and codes."
+        self._data = data
+        self.hashes = data[0]
+        self._codes = data[1]
+        self.key = key
+        self.normalize = key_function(key)
+
+    def __len__(self):
+        return self.hashes.size
+
+    @classmethod
+    def from_records(cls, emails, statuses, clean_types, normalize=None, key=None):
+        """
+        Builds a snapshot from parallel sequences. When an email appears
+        more than once (after normalizing) the last record wins.
+        Emails are normalized with normalize, or key_function(key) when a key is given.
+        """
+        if normalize is None and key is not None:
+            normalize = key_function(key)
+        emails = pd.Series(emails, dtype=object)
+        if normalize is not None:
+            emails = emails.apply(normalize)
+        keep = (emails.notnull() & (emails != '')).values
+        hashes = hash_emails(emails.values[keep])
+        codes = status_codes(np.asarray(statuses, dtype=object)[keep])
+        codes = codes | (np.asarray(clean_types, dtype=np.uint64)[keep] << np.uint64(8))
+        return cls._from_arrays(hashes, codes, key=key)
+
+    @classmethod
+    def _from_arrays(cls, hashes, codes, key=None):
+        # A stable sort keeps the original order within equal hashes - take the last one.
+        order = np.argsort(hashes, kind='stable')
+        hashes, codes = hashes[order], codes[order]
+        last = np.ones(hashes.size, dtype=bool)
+        if hashes.size:
+            last[:-1] = hashes[1:] != hashes[:-1]
+        return cls(np.vstack([hashes[last], codes[last]]).astype(np.uint64), key=key)
+
+    @classmethod
+    def from_frames(cls, frames, normalize=None, key=None):
+        """
+        Compiles a snapshot from an iterable of pandas.DataFrames with email, 
+        email_status & clean_type columns (e.g. CacheBackend.scan()).
+        Later records win over earlier ones.
+        """
+        if normalize is None and key is not None:
+            normalize = key_function(key)
+        hashes, codes = [], []
+        for chunk in frames:
+            snap = cls.from_records(chunk['email'], chunk['email_status'], chunk['clean_type'].fillna(0),
+                                    normalize=normalize)
+            hashes.append(snap.hashes)
+            codes.append(snap._codes)
+        if not hashes:
+            return cls(np.empty((2, 0), dtype=np.uint64), key=key)
+        return cls._from_arrays(np.concatenate(hashes), np.concatenate(codes), key=key)
+
+    @classmethod
+    def from_db(cls, db, normalize=None, sql=SNAPSHOT_SQL, chunksize=500000, key=None):
+        """
+        Compiles a snapshot from the emails table of a SimpleSQLite3 database,
+        reading chunksize rows at a time. Newer records win over older ones.
+        """
+        return cls.from_frames(db.read_sql(sql, chunksize=chunksize), normalize=normalize, key=key)
+
+    def save(self, path):
+        """Saves the snapshot (.npy) and its key metadata (.npy.json) when it has any."""
+        path = str(path)
+        if not path.endswith('.npy'):
+            path += '.npy'
+        np.save(path, np.ascontiguousarray(self._data))
+        if self.key is not None:
+            with open(key_path(path), 'w') as fh:
+                json.dump(self.key, fh)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Loads a snapshot, memory-mapped (read-only) unless mmap is False."""
+        path = str(path)
+        key = None
+        if os.path.exists(key_path(path)):
+            with open(key_path(path)) as fh:
+                key = json.load(fh)
+        return cls(np.load(path, mmap_mode=('r' if mmap else None)), key=key)
+
+    def _find(self, hashes):
+        """Returns (index, found mask) of each hash in the snapshot."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(self):
+            return np.zeros(hashes.size, dtype=np.intp), np.zeros(hashes.size, dtype=bool)
+        idx = np.searchsorted(self.hashes, hashes)
+        idx[idx == len(self)] = 0
+        return idx, self.hashes[idx] == hashes
+
+    def lookup_hashes(self, hashes, clean_type=None):
+        """
+        Returns a uint8 array of status codes (0 = not found) for an array of hashes.
+        When clean_type is given, records with a different clean_type count as not found.
+        """
+        idx, found = self._find(hashes)
+        if not len(self):
+            return np.zeros(idx.size, dtype=np.uint8)
+        codes = np.asarray(self._codes[idx])
+        if clean_type is not None:
+            found &= (codes >> np.uint64(8)) == clean_type
+        return np.where(found, codes & np.uint64(0xFF), 0).astype(np.uint8)
+
+    def lookup_many(self, emails, clean_type=None, normalize=None):
+        """
+        Returns a uint8 array of status codes (0 = not found) for an iterable of emails.
+        Emails are keyed with normalize, which defaults to the snapshot's own key function.
+        """
+        emails = pd.Series(emails, dtype=object).fillna('')
+        emails = emails.map(self.normalize if normalize is None else normalize)
+        return self.lookup_hashes(hash_emails(emails.values), clean_type=clean_type)
+
+    def lookup(self, email, clean_type=None, normalize=None):
+        """Returns the email_status of one email address or None if it's unknown."""
+        code = int(self.lookup_many([email], clean_type=clean_type, normalize=normalize)[0])
+        if not code:
+            return None
+        return STATUS_NAMES.get(code, 'other')
+
+    def contains(self, emails, clean_type=None):
+        return self.lookup_many(emails, clean_type=clean_type) != 0
+
+    def is_clean(self, emails, clean_type=None):
+        return np.isin(self.lookup_many(emails, clean_type=clean_type), CLEAN_CODES)
+
+    def is_bad(self, emails, clean_type=None):
+        """True for emails in the snapshot with any status other than clean/catch-all."""
+        codes = self.lookup_many(emails, clean_type=clean_type)
+        return (codes != 0) & ~np.isin(codes, CLEAN_CODES)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Incremental sync of the emails cache between nodes without a live service.
+
+Every database gets a random node id and every insert/update of a verdict
+in emails stamps the row with the next value of a per-node change
+sequence (emails.change_seq, maintained by triggers). A node exports the
+rows changed after a sequence number to a gzipped JSON lines delta file:
+    {"node_id":"...","from_seq":120,"to_seq":480,"fields":[...],"timezone":"utc"}
+    ["tony@yahoo.com","clean","yes","no",0,1,"2026-10-01 10:00:00","2026-10-20 08:12:41",121]
+    ...
+The emails table stores local times, so insertdate & updatedate are 
+converted to UTC on export and back to local time on import - nodes 
+in different timezones compare the same instants. Other nodes merge 
+delta files in bulk. An incoming verdict replaces the local one when it 
+is a deep clean replacing a quick clean, or when it has the same 
+clean_type and a newer updatedate (compared in UTC). Merging is idempotent, so delta files can be 
+imported more than once and in any order. Importing remembers how far 
+each peer's changes have been imported without gaps (its watermark), 
+which is where that peer's next export should start. Deletes are not synced.
+
+    since = node_b.sync_watermark(node_a.node_id)
+    node_a.export_changes('a.delta.gz', since=since)
+    node_b.import_changes('a.delta.gz')
+"""
+import gzip
+import json
+import uuid
+
+SYNC_FIELDS = ('email', 'email_status', 'free_mail', 'typo_fixed',
+               'dealno', 'clean_type', 'insertdate', 'updatedate', 'change_seq')
+
+# Unfinished verdicts stay on the node that is waiting for them.
+UNSYNCED_STATUSES = ('processing',)
+
+SYNC_NODE = 'sync_node'
+
+SYNC_NODE_SQL_TABLE = """CREATE TABLE sync_node (
+    node_id    VARCHAR (32) NOT NULL,
+    change_seq INTEGER      DEFAULT (0)
+)"""
+
+SYNC_PEERS_SQL_TABLE = """CREATE TABLE sync_peers (
+    node_id  VARCHAR (32) PRIMARY KEY,
+    last_seq INTEGER      DEFAULT (0),
+    syncdate DATETIME     DEFAULT (DATETIME('now', 'localtime') )
+)"""
+
+SYNC_TRIGGERS_SQL = [
+"""CREATE INDEX IF NOT EXISTS emails_change_seq ON emails (change_seq)""",
+"""CREATE TRIGGER IF NOT EXISTS emails_seq_insert AFTER INSERT ON emails
+BEGIN
+    UPDATE sync_node SET change_seq = change_seq + 1;
+    UPDATE emails SET change_seq = (SELECT change_seq FROM sync_node) WHERE email_id = NEW.email_id;
+END""",
+"""CREATE TRIGGER IF NOT EXISTS emails_seq_update 
+AFTER UPDATE OF email_status, free_mail, typo_fixed, dealno, clean_type ON emails
+BEGIN
+    UPDATE sync_node SET change_seq = change_seq + 1;
+    UPDATE emails SET change_seq = (SELECT change_seq FROM sync_node) WHERE email_id = NEW.email_id;
+END"""]
+
+IMPORT_SQL_TABLE = """CREATE TEMP TABLE IF NOT EXISTS sync_import (
+    email        VARCHAR (30) PRIMARY KEY ON CONFLICT REPLACE,
+    email_status VARCHAR (30),
+    free_mail    VARCHAR (30),
+    typo_fixed   VARCHAR (30),
+    dealno       INT (30),
+    clean_type   INT (30),
+    insertdate   DATETIME,
+    updatedate   DATETIME
+)"""
+
+SYNC_TIMEZONE = 'utc'
+
+# Export columns, with the local dates converted to UTC.
+EXPORT_COLUMNS = tuple("DATETIME({0}, 'utc')".format(f) if f in ('insertdate', 'updatedate') else f
+                       for f in SYNC_FIELDS)
+
+# sync_import holds UTC dates, they're stored in local time.
+# Deep (clean_type 1) beats quick (0), then the newest updatedate (in UTC) wins.
+MERGE_SQL = """INSERT INTO emails (email, email_status, free_mail, typo_fixed, dealno, clean_type, insertdate, updatedate)
+    SELECT email, email_status, free_mail, typo_fixed, dealno, clean_type, 
+           DATETIME(insertdate, 'localtime'), DATETIME(updatedate, 'localtime')
+    FROM sync_import WHERE true
+    ON CONFLICT(email) DO UPDATE SET
+        email_status = excluded.email_status,
+        free_mail = excluded.free_mail,
+        typo_fixed = excluded.typo_fixed,
+        dealno = excluded.dealno,
+        clean_type = excluded.clean_type,
+        updatedate = excluded.updatedate
+    WHERE excluded.clean_type > IFNULL(emails.clean_type, 0)
+       OR (excluded.clean_type = IFNULL(emails.clean_type, 0)
+           AND DATETIME(excluded.updatedate, 'utc') > IFNULL(DATETIME(emails.updatedate, 'utc'), ''))"""
+
+
+def create_sync_tables(db):
+    """
+    Adds emails.change_seq, the sync tables & triggers to a SimpleSQLite3 
+    database that doesn't have them. Existing rows are numbered in email_id order.
+    """
+    if db.sql_exists(SYNC_NODE):
+        return
+    with db.con:
+        db.cur.execute("BEGIN")
+        if not db.sql_exists('emails', fields=['change_seq']):
+            db.cur.execute("ALTER TABLE emails ADD COLUMN change_seq INTEGER")
+        db.cur.execute("UPDATE emails SET change_seq = email_id")
+        db.cur.execute(SYNC_NODE_SQL_TABLE)
+        db.cur.execute(SYNC_PEERS_SQL_TABLE)
+        db.cur.execute("INSERT INTO sync_node (node_id, change_seq) VALUES (?, (SELECT IFNULL(MAX(email_id), 0) FROM emails))",
+                       (uuid.uuid4().hex,))
+        for sql in SYNC_TRIGGERS_SQL:
+            db.cur.execute(sql)
+
+
+def node_id(db):
+    return db.fetch_value("SELECT node_id FROM sync_node")
+
+
+def change_seq(db):
+    """The last change sequence number assigned on this node."""
+    return db.fetch_value("SELECT change_seq FROM sync_node")
+
+
+def peer_watermark(db, peer_id):
+    """The highest change_seq imported from peer_id (0 if none)."""
+    seq = db.fetch_value("SELECT last_seq FROM sync_peers WHERE node_id = ?", (peer_id,))
+    return (seq if seq is not None else 0)
+
+
+def export_changes(db, path, since=0, batch_size=10000):
+    """
+    Writes the emails rows changed after change_seq since to a gzipped 
+    JSON lines delta file at path (dates in UTC). Returns the number of rows written.
+    """
+    to_seq = change_seq(db)
+    header = {'node_id': node_id(db), 'from_seq': since, 'to_seq': to_seq, 'fields': SYNC_FIELDS,
+              'timezone': SYNC_TIMEZONE}
+    sql = """SELECT {} FROM emails WHERE change_seq > ? AND change_seq <= ? 
+             AND IFNULL(email_status, '') NOT IN ({}) ORDER BY change_seq""".format(
+        ",".join(EXPORT_COLUMNS), ",".join("?" * len(UNSYNCED_STATUSES)))
+    cur = db.con.cursor()
+    cur.row_factory = None
+    cur.execute(sql, [since, to_seq] + list(UNSYNCED_STATUSES))
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as fh:
+        fh.write(json.dumps(header, separators=(',', ':')) + "\n")
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            for row in batch:
+                fh.write(json.dumps(row, separators=(',', ':')) + "\n")
+            rows += len(batch)
+    return rows
+
+
+def read_changes(path):
+    """Returns (header dict, list of row lists) from a delta file."""
+    with gzip.open(path, 'rt', encoding='utf-8') as fh:
+        header = json.loads(fh.readline())
+        assert tuple(header.get('fields', ())) == SYNC_FIELDS, "Unknown delta file fields: {}".format(header.get('fields'))
+        assert header.get('timezone', None) == SYNC_TIMEZONE, "Expected UTC dates in the delta file."
+        return header, [json.loads(line) for line in fh if line.strip()]
+
+
+def import_changes(db, path):
+    """
+    Merges a delta file into the emails table. Files exported by this 
+    node are skipped. The watermark of the node that exported it only moves
+    when the file starts at or below it - a file after a gap leaves it
+    where it is so the missing changes are exported again.
+    Returns the number of local rows inserted or replaced.
+    """
+    header, rows = read_changes(path)
+    peer = header['node_id']
+    if peer == node_id(db):
+        return 0
+    watermark = peer_watermark(db, peer)
+    seq = SYNC_FIELDS.index('change_seq')
+    rows = [r[:seq] for r in rows]
+    with db.con:
+        db.cur.execute(IMPORT_SQL_TABLE)
+        db.cur.execute("DELETE FROM sync_import")
+        db.cur.executemany("INSERT INTO sync_import ({}) VALUES ({})".format(
+            ",".join(SYNC_FIELDS[:seq]), ",".join("?" * seq)), rows)
+        applied = (db.cur.execute(MERGE_SQL).rowcount if rows else 0)
+        db.cur.execute("DELETE FROM sync_import")
+        if header['from_seq'] > watermark:
+            return applied
+        db.cur.execute("""INSERT INTO sync_peers (node_id, last_seq) VALUES (?, ?)
+                          ON CONFLICT(node_id) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq),
+                          syncdate = DATETIME('now', 'localtime')""", (peer, header['to_seq']))
+    return applied
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""A write-behind writer for the verdict cache. API workers put records on
+a bounded queue and return immediately, one writer thread owns its own
+backend (its own SQLite connection) and writes them in batched transactions.
+Deletes & other statements on the same database go through the queue too,
+in order, so no other connection holds a write lock the writer waits on.
+
+    with WriteBehindWriter(lambda: SQLiteBackend(SimpleSQLite3(path))) as writer:
+        writer.put(record)
+        writer.delete(['spam@trap.com'])
+        writer.pending(['tony@yahoo.com'])   # records not written yet
+        writer.flush()                       # every write queued so far is committed
+"""
+import threading
+from queue import Queue, Empty
+from .backends import RECORD_FIELDS, _now
+
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_BATCH_SIZE = 500
+
+PUT = 'put'
+DELETE = 'delete'
+EXECUTE = 'execute'
+
+_STOP = (None,)
+
+
+class WriteBehindWriter:
+    """
+    Writes records to a CacheBackend on a background thread.
+
+    PARAMETERS:
+    ============
+    backend_factory - a callable returning the CacheBackend to write to. 
+        It is called on the writer thread, so a SQLite backend gets a 
+        connection of its own.
+
+    max_queue - (int) the max number of writes waiting, put(), delete() 
+        & execute() block while the queue is full.
+
+    batch_size - (int) the max number of writes per transaction.
+
+    flush_interval - (float) seconds the writer waits for more records
+        before committing what it has.
+    """
+    def __init__(self, backend_factory, max_queue=DEFAULT_MAX_QUEUE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=0.05):
+        assert max_queue > 0, "max_queue must be greater than 0."
+        assert batch_size > 0, "batch_size must be greater than 0."
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._factory = backend_factory
+        self._queue = Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._error = None
+        self.batches = 0
+        self.written = 0
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='listwise-writer', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        self._raise_error()
+
+    def _put(self, op, emails=()):
+        self._raise_error()
+        with self._lock:
+            for email in emails:
+                self._pending[email] = op
+        self._queue.put(op)
+
+    def put(self, record):
+        """Queues a record to be written, blocks while the queue is full."""
+        record = {k: record.get(k, None) for k in RECORD_FIELDS}
+        record['updatedate'] = _now()
+        self._put((PUT, record), [record['email']])
+
+    def delete(self, emails):
+        """Queues emails to be deleted from the backend."""
+        emails = list(emails)
+        self._put((DELETE, emails), emails)
+
+    def execute(self, sql, params=()):
+        """Queues a statement to run on the writer's SimpleSQLite3 database (SQLite backends only)."""
+        self._put((EXECUTE, sql, params))
+
+    def pending(self, emails):
+        """
+        Returns {email: record} for the emails queued but not written yet,
+        the record is None when the email is queued to be deleted.
+        """
+        with self._lock:
+            ops = {e: self._pending[e] for e in emails if e in self._pending}
+        return {e: (dict(op[1]) if op[0] == PUT else None) for e, op in ops.items()}
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Blocks until every write queued so far is committed. Re-raises a write error."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Flushes the queue and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def stats(self):
+        return {'write_batches': self.batches, 'writes': self.written}
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        try:
+            backend = self._factory()
+        except Exception as e:
+            self._error = e
+            return
+        finally:
+            self._ready.set()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                except Empty:
+                    break
+            ops = [op for op in batch if op is not _STOP]
+            try:
+                if ops:
+                    self._write(backend, ops)
+                    backend.commit()
+                    self.batches += 1
+                    self.written += sum(1 for op in ops if op[0] == PUT)
+            except Exception as e:
+                backend.rollback()
+                if self._error is None:
+                    self._error = e
+            finally:
+                with self._lock:
+                    for op in ops:
+                        emails = ([op[1]['email']] if op[0] == PUT else op[1] if op[0] == DELETE else [])
+                        for email in emails:
+                            if self._pending.get(email, None) is op:
+                                del self._pending[email]
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is _STOP:
+                return
+
+    def _write(self, backend, ops):
+        """Applies ops in order, runs of puts are written with one put_many."""
+        records = []
+        for op in ops:
+            if op[0] == PUT:
+                records.append(op[1])
+                continue
+            if records:
+                backend.put_many(records)
+                records = []
+            if op[0] == DELETE:
+                backend.delete(op[1])
+            else:
+                backend.db.execute(op[1], op[2])
+        if records:
+            backend.put_many(records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -47,6 +47,9 @@ setup(
                     'pandas',
                     ],
     cmdclass={'test': PyTest},
+    entry_points={
+        'console_scripts': ['listwise = listwise.cli:main'],
+    },
     author_email='zekebarge@gmail.com',
     description='ListWise.com email validation wrapper.',
     long_description=long_description,
@@ -69,6 +72,7 @@ setup(
         ],
     extras_require={
         'testing': ['pytest'],
+        'parquet': ['pyarrow'],
     }
 )
 
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pytest
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.backends import MemoryBackend, DbmBackend, make_record, benchmark_backend
+
+RESPONSES = [dict(email='tony@yahoo.com', email_status='clean', free_mail='yes', typo_fixed='no'),
+             dict(email='spam@trap.com', email_status='spam-trap', free_mail='no', typo_fixed='no'),
+             dict(email='stuck@slow.com', email_status='processing', free_mail='no', typo_fixed='no')]
+
+
+@pytest.fixture(params=['sqlite', 'memory', 'dbm'])
+def backend(request, tmp_path):
+    if request.param == 'sqlite':
+        lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+        yield lw.backend
+    elif request.param == 'memory':
+        yield MemoryBackend()
+    else:
+        b = DbmBackend(str(tmp_path / "listwise.dbm"))
+        yield b
+        b.close()
+
+
+def test_backend_contract(backend):
+    backend.put_many([make_record(r, dealno=7, clean_type=1) for r in RESPONSES])
+    backend.commit()
+    found = backend.get_many(['tony@yahoo.com', 'nobody@nowhere.com'])
+    assert list(found) == ['tony@yahoo.com']
+    assert found['tony@yahoo.com']['email_status'] == 'clean'
+    assert found['tony@yahoo.com']['updatedate'], "Expected the backend to set updatedate."
+    inserted = found['tony@yahoo.com']['insertdate']
+
+    version = backend.version()
+    backend.put_many([make_record(dict(RESPONSES[0], email_status='bounced'), np.int64(7), 1)])
+    assert backend.version() != version, "Expected writes to change the version."
+    record = backend.get('tony@yahoo.com')
+    assert record['email_status'] == 'bounced'
+    assert record['insertdate'] == inserted, "Expected updates to keep the insertdate."
+
+    assert backend.count() == 3
+    assert backend.count(dealno=7, email_status='processing') == 1
+    frame = backend.read_frame(email_status='processing')
+    assert frame['email'].tolist() == ['stuck@slow.com']
+
+    backend.delete(['spam@trap.com', 'nobody@nowhere.com'])
+    backend.commit()
+    assert backend.get('spam@trap.com') is None
+    assert sorted(pd.concat(list(backend.scan(chunksize=1)))['email']) == ['stuck@slow.com', 'tony@yahoo.com']
+
+
+def test_benchmark_backend(backend):
+    results = benchmark_backend(backend, n=200, bulk_size=50, single_lookups=20)
+    assert sorted(results) == ['bulk_lookup_us', 'miss_lookup_us', 'put_per_record_us', 'single_lookup_us']
+    assert all(v > 0 for v in results.values())
+
+
+def test_listwise_with_memory_backend(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False, backend=MemoryBackend())
+    lw._deep_clean = lambda email: dict(RESPONSES[0], email=email)
+    df = pd.DataFrame({'email': ['Tony@Yahoo.com', 'tony@yahoo.com', 'bad']})
+    df = lw.deep_clean_frame(df)
+    assert df['EMAIL_CLEANED'].tolist() == ['tony@yahoo.com', 'tony@yahoo.com', '']
+    assert lw.metrics['calls'] == 1
+    assert lw.check_db('tony@yahoo.com') == {'email': 'tony@yahoo.com'}
+    assert lw.db.count_records('emails') == 0, "Expected nothing written to the SQLite emails table."
+    assert lw.merge_email_frame(pd.DataFrame({'email': ['tony@yahoo.com', 'x@y.com']}))['email'].tolist() == \
+        ['tony@yahoo.com']
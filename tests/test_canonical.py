@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.canonical import Canonicalizer
+from listwise.snapshot import EmailSnapshot
+
+
+def test_canonicalize():
+    c = Canonicalizer()
+    assert c.canonicalize('john.doe+promo@gmail.com') == 'johndoe@gmail.com'
+    assert c.canonicalize('john.doe+promo@googlemail.com') == 'johndoe@gmail.com'
+    assert c.canonicalize('john.doe+promo@gmial.com') == 'johndoe@gmail.com'
+    assert c.canonicalize('john.doe+promo@outlook.com') == 'john.doe@outlook.com'
+    assert c.canonicalize('john.doe+promo@example.com') == 'john.doe+promo@example.com', \
+        "Expected unknown providers to be left alone."
+    assert c.canonicalize('+promo@gmail.com') == '+promo@gmail.com'
+    assert c.canonicalize('') == ''
+    assert c.repair('john.doe+promo@gmial.com') == 'john.doe+promo@gmail.com'
+
+    custom = Canonicalizer(rules={'example.com': {'plus_tags': True}, 'gmail.com': None}, repair_typos=False)
+    assert custom.canonicalize('a+b@example.com') == 'a@example.com'
+    assert custom.canonicalize('j.d+x@gmail.com') == 'j.d+x@gmail.com'
+    assert custom.canonicalize('j.d@gmial.com') == 'j.d@gmial.com'
+
+
+def test_clean_series_shares_canonical_verdicts(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False, canonicalizer=Canonicalizer())
+    calls = []
+
+    def fake_deep_clean(email):
+        calls.append(email)
+        return dict(email=email, email_status='clean', free_mail='yes', typo_fixed='no')
+    lw._deep_clean = fake_deep_clean
+
+    emails = pd.Series(['John.Doe+promo@gmail.com', 'johndoe@gmail.com', 'j.o.h.n.d.o.e@gmial.com', 'bad'])
+    cleaned = lw.clean_series(emails)
+    assert calls == ['johndoe@gmail.com'], "Expected one API call for three spellings of one mailbox."
+    assert cleaned.tolist() == ['john.doe+promo@gmail.com', 'johndoe@gmail.com', 'j.o.h.n.d.o.e@gmail.com', '']
+    assert lw.metrics['canonical_merged'] == 2
+    assert lw.deep_clean_one2('john.doe@googlemail.com') == 'john.doe@googlemail.com'
+    assert calls == ['johndoe@gmail.com'], "Expected the canonical verdict to be reused."
+    assert lw.merge_email_mask(pd.Series(['jo.hn.doe+x@gmail.com', 'x@y.com'])).tolist() == [True, False]
+
+
+def test_api_typo_fix_is_kept(tmp_path):
+    calls = []
+
+    def fake_deep_clean(email):
+        calls.append(email)
+        return dict(email=email.replace('@gmali.com', '@gmail.com'), email_status='clean',
+                    free_mail='yes', typo_fixed='yes')
+
+    for canonicalizer in (None, Canonicalizer()):
+        lw = listwise.ListWise(str(tmp_path / "listwise{}.db".format(len(calls))), test_credentials=False,
+                               canonicalizer=canonicalizer)
+        lw._deep_clean = fake_deep_clean
+        assert lw.clean_series(pd.Series(['bob@gmali.com'])).tolist() == ['bob@gmail.com']
+        assert lw.backend.get_many(['bob@gmali.com'])['bob@gmali.com']['email_status'] == 'clean', \
+            "Expected the verdict stored under the cache key."
+        lw.clean_series(pd.Series(['bob@gmali.com']))
+    assert calls == ['bob@gmali.com'] * 2, "Expected the second clean_series to hit the cache."
+
+
+def test_snapshot_applies_canonicalizer(tmp_path):
+    custom = Canonicalizer(rules={'example.com': {'plus_tags': True}, 'outlook.com': None})
+    assert Canonicalizer(**custom.config()).rules == custom.rules
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False, canonicalizer=custom)
+    for email in ('johndoe@gmail.com', 'a@example.com'):
+        lw._insert_response(dict(email=email, email_status='bounced', free_mail='no', typo_fixed='no'),
+                            clean_type=1)
+    lw.db.con.commit()
+
+    path = str(tmp_path / "emails.npy")
+    lw.export_snapshot(path)
+    snap = EmailSnapshot.load(path)
+    assert snap.lookup('John.Doe+x@gmail.com') == 'bounced'
+    assert snap.lookup('a+b@example.com') == 'bounced'
+    assert snap.is_bad(['john.doe@googlemail.com', 'jane@gmail.com']).tolist() == [True, False]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import json
+import pytest
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.ListWise import ERROR_CODE
+from listwise.cassette import RecordingTransport, ReplayTransport, CassetteMissError, strip_secrets
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = (json.dumps(body) if body is not None else '<html>Bad Gateway</html>')
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("Not JSON")
+        return self.body
+
+
+class FakeAPI:
+    """Answers every email with clean unless it contains 'bad'."""
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        email = dict(p.split('=', 1) for p in url.split('?', 1)[1].split('&'))['email']
+        if email == 'gateway@error.com':
+            return FakeResponse(502, None)
+        status = ('invalid' if 'bad' in email else 'clean')
+        return FakeResponse(200, dict(email=email, email_status=status, free_mail='no', typo_fixed='no'))
+
+
+def test_strip_secrets():
+    url = "https://api.listwisehq.com/clean/deep.php?email=tony@yahoo.com&api_key=secret"
+    assert 'secret' not in strip_secrets(url)
+    assert 'email=tony%40yahoo.com' in strip_secrets(url)
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    api = FakeAPI()
+    with RecordingTransport(path, transport=api) as rec:
+        lw = listwise.ListWise(str(tmp_path / "record.db"), api_key='secret', test_credentials=False, transport=rec)
+        assert lw._deep_clean('tony@yahoo.com')['email_status'] == 'clean'
+        assert lw._quick_clean('bad@yahoo.com')['email_status'] == 'invalid'
+        rec.get("https://api.listwisehq.com/clean/deep.php?email=gateway@error.com&api_key=secret")
+    assert rec.recorded == 3
+    with open(path) as fh:
+        contents = fh.read()
+    assert 'secret' not in contents, "Expected the api_key to be stripped from the cassette."
+
+    slept = []
+    replay = ReplayTransport(path, speed=4, sleeper=slept.append)
+    assert len(replay) == 3
+    lw = listwise.ListWise(str(tmp_path / "replay.db"), api_key='other', test_credentials=False, transport=replay)
+    assert lw._deep_clean('tony@yahoo.com')['email_status'] == 'clean'
+    assert lw._deep_clean('tony@yahoo.com')['email_status'] == 'clean', "Expected the last response to repeat."
+    assert lw._quick_clean('bad@yahoo.com')['email_status'] == 'invalid'
+    r = replay.get("https://api.listwisehq.com/clean/deep.php?email=gateway@error.com")
+    assert r.status_code == 502
+    with pytest.raises(ValueError):
+        r.json()
+    assert len(slept) == 4 and all(s >= 0 for s in slept)
+    with pytest.raises(CassetteMissError):
+        lw._deep_clean('never@recorded.com')
+
+
+def test_replay_frame_offline(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    df = pd.DataFrame({'email': ['tony@yahoo.com', 'bad@yahoo.com', 'tina@gmail.com']})
+    with RecordingTransport(path, transport=FakeAPI()) as rec:
+        lw = listwise.ListWise(str(tmp_path / "record.db"), test_credentials=False, transport=rec)
+        recorded = lw.deep_clean_frame(df.copy())
+
+    lw = listwise.ListWise(str(tmp_path / "replay.db"), test_credentials=False,
+                           transport=ReplayTransport(path))
+    replayed = lw.deep_clean_frame(df.copy())
+    pd.testing.assert_frame_equal(recorded, replayed)
+    assert lw.check_db('bad@yahoo.com', clean_type=1) is None
+    assert lw.check_db('tony@yahoo.com', clean_type=1) == {'email': 'tony@yahoo.com'}
+    assert ERROR_CODE not in lw._deep_clean('tina@gmail.com')
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import subprocess
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from listwise import cli
+from listwise.ListWise import ListWise, EMAIL
+from listwise import fileio
+
+
+def fake_deep_clean(self, email):
+    status = ('spam-trap' if email.startswith('spam') else 'clean')
+    return dict(email=email, email_status=status, free_mail='no', typo_fixed='no')
+
+
+def test_clean_suppress_count(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(ListWise, '_deep_clean', fake_deep_clean)
+    db = str(tmp_path / "listwise.db")
+    src = str(tmp_path / "list.csv")
+    pd.DataFrame({'EMAIL': ['Tony@Yahoo.com', 'spam@trap.com', 'bad', 'tony@yahoo.com'],
+                  'NAME': ['a', 'b', 'c', 'd']}).to_csv(src, index=False)
+
+    cleaned = str(tmp_path / "cleaned.csv")
+    cli.main(['--db', db, '--metrics', 'clean', src, '-o', cleaned, '-c', 'EMAIL',
+              '--workers', '4', '--batch-size', '2', '--drop-invalid'])
+    out = pd.read_csv(cleaned)
+    assert out['EMAIL'].tolist() == ['tony@yahoo.com', 'tony@yahoo.com']
+    assert out['NAME'].tolist() == ['a', 'd']
+    err = capsys.readouterr().err
+    assert "calls: 2" in err, "Expected one API call per unique email missing from the database."
+    assert "cache_hits: 1" in err, "Expected the second batch to find tony@yahoo.com in the database."
+
+    suppressed = str(tmp_path / "suppressed.csv")
+    cli.main(['--db', db, 'suppress', src, '-o', suppressed, '-c', 'EMAIL'])
+    assert pd.read_csv(suppressed)['NAME'].tolist() == ['a', 'd']
+
+    cli.main(['--db', db, 'count', src, '-c', 'EMAIL'])
+    assert capsys.readouterr().out.strip() == '3'
+
+
+def test_help_skips_command_imports():
+    assert cli.EMAIL == EMAIL and cli.DEFAULT_BATCH_SIZE == fileio.DEFAULT_BATCH_SIZE
+    code = ("import sys\nfrom listwise import cli\n"
+            "try:\n    cli.main(['--help'])\nexcept SystemExit:\n    pass\n"
+            "print(sorted(m for m in ('pandas', 'numpy', 'requests', 'pyarrow', 'listwise.ListWise') if m in sys.modules))")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    assert out.strip().endswith('[]'), "Expected --help not to import the command modules."
+    import listwise
+    assert isinstance(listwise.ListWise, type) and isinstance(listwise.SimpleSQLite3, type)
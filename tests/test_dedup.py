@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise import dedup
+
+RAW_EMAILS = ['Tony@Yahoo.com', 'tony@yahoo.com', 'bad', 'tina@gmail.com;tory@gmail.com',
+              None, 'tina@gmail.com', 'TINA@gmail.com ', 'new@new.com', 'bad#email@gmail.com'] * 50
+
+
+def test_external_matches_pandas(tmp_path):
+    rng = np.random.RandomState(0)
+    values = np.array(["user{}@example.com".format(i) for i in rng.randint(0, 300, 2000)], dtype=object)
+    expected = pd.Series(values).duplicated().values
+    result = dedup.duplicated(values, max_memory=10000, spill_dir=str(tmp_path), chunksize=333)
+    assert dedup.partitions_for(values.size, 10000) > 1, "Expected the test to spill."
+    assert (result == expected).all()
+    assert os.listdir(str(tmp_path)) == [], "Expected the spill files to be cleaned up."
+
+
+def test_pre_process_frame_out_of_core(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    frame = pd.DataFrame({'email': RAW_EMAILS, 'row': range(len(RAW_EMAILS))})
+    expected = lw.pre_process_frame(frame.copy())
+    result = lw.pre_process_frame(frame.copy(), max_memory=1000, spill_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(result, expected)
+    assert result['email'].tolist() == ['tony@yahoo.com', 'tina@gmail.com', 'new@new.com']
+
+
+def test_partitions_are_capped(tmp_path):
+    rng = np.random.RandomState(1)
+    values = np.array(["user{}@example.com".format(i) for i in rng.randint(0, 5000, 20000)], dtype=object)
+    expected = pd.Series(values).duplicated().values
+    assert dedup.partitions_for(values.size, 10000) > dedup.MAX_PARTITIONS, "Expected the test to re-partition."
+
+    opened = []
+    real_init = dedup.ExternalDeduper.__init__
+
+    def counting_init(self, *args, **kwargs):
+        real_init(self, *args, **kwargs)
+        opened.append(self.n_partitions)
+    dedup.ExternalDeduper.__init__ = counting_init
+    try:
+        result = dedup.duplicated(values, max_memory=10000, spill_dir=str(tmp_path), chunksize=3000)
+    finally:
+        dedup.ExternalDeduper.__init__ = real_init
+    assert max(opened) <= dedup.MAX_PARTITIONS and len(opened) > 1
+    assert (result == expected).all()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_failed_init_cleans_up(tmp_path, monkeypatch):
+    import builtins
+    real_open = builtins.open
+    calls = []
+
+    def failing_open(path, *args, **kwargs):
+        calls.append(path)
+        if len(calls) > 3:
+            raise OSError(24, "Too many open files")
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr(builtins, 'open', failing_open)
+    try:
+        dedup.ExternalDeduper(n_partitions=10, spill_dir=str(tmp_path))
+        assert False, "Expected an OSError."
+    except OSError:
+        pass
+    monkeypatch.undo()
+    assert os.listdir(str(tmp_path)) == [], "Expected the spill directory to be removed."
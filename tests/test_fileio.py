@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pytest
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise import fileio
+
+RAW_EMAILS = ['Tony@Yahoo.com', 'bad#email@gmail.com', 'tina@gmail.com;tory@gmail.com',
+              'tony@yahoo.com', 'spam@trap.com', None]
+
+
+def fake_deep_clean(email):
+    status = ('spam-trap' if email.startswith('spam') else 'clean')
+    return dict(email=email, email_status=status, free_mail='no', typo_fixed='no')
+
+
+def sample_frame():
+    return pd.DataFrame({'EMAIL': RAW_EMAILS, 'NAME': ['a', 'b', 'c', 'd', 'e', 'f'],
+                         'AMOUNT': [1.5, 2.5, 3.5, 4.5, 5.5, 6.5]})
+
+
+def test_output_path():
+    assert fileio.output_path("C:/data/list.csv") == "C:/data/list-LISTWISED.csv"
+    assert fileio.output_path("/data/list.csv", fmt=fileio.PARQUET) == "/data/list-LISTWISED.parquet"
+
+
+@pytest.mark.parametrize("ext", ['.csv', '.parquet', '.arrow'])
+def test_process_multiple_files(tmp_path, ext):
+    if ext != '.csv':
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / ("list" + ext))
+    with fileio.FrameWriter(path) as writer:
+        writer.write(sample_frame())
+
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    lw._deep_clean = fake_deep_clean
+    new_paths = lw.process_multiple_files([path], email_col='EMAIL', min_size=1)
+
+    assert new_paths == [str(tmp_path / ("list-LISTWISED" + ext))]
+    out = fileio.read_frame(new_paths[0])
+    assert out['EMAIL'].tolist() == ['tony@yahoo.com', 'tina@gmail.com'], \
+        "Expected parsed, de-duplicated emails with the spam-trap suppressed."
+    assert out['NAME'].tolist() == ['a', 'c'], "Expected the other columns to be streamed through."
+    assert out['AMOUNT'].tolist() == [1.5, 3.5]
+
+
+def test_process_multiple_files_cleaned_addresses(tmp_path):
+    path = str(tmp_path / "list.csv")
+    sample_frame().assign(EMAIL=['john@gmial.com', 'Tony@Yahoo.com', 'tina@gmail.com',
+                                 'spam@trap.com', 'tony@yahoo.com', None]).to_csv(path, index=False)
+
+    def fixing_deep_clean(email):
+        resp = fake_deep_clean(email)
+        if email == 'john@gmial.com':
+            resp.update(email='john@gmail.com', typo_fixed='yes')
+        return resp
+
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    lw._deep_clean = fixing_deep_clean
+    new_paths = lw.process_multiple_files([path], email_col='EMAIL', min_size=1)
+    out = fileio.read_frame(new_paths[0])
+    assert out['EMAIL'].tolist() == ['john@gmail.com', 'tony@yahoo.com', 'tina@gmail.com'], \
+        "Expected rows the API fixed to be kept with the address it returned."
+    assert out['NAME'].tolist() == ['a', 'b', 'c']
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.freshness import FreshnessPolicy
+
+SAMPLE_RESPONSE = dict(email='zekebarge@gmail.com', email_status='clean', free_mail='yes', typo_fixed='no')
+EMAIL = SAMPLE_RESPONSE['email']
+
+
+def make_listwise(tmp_path, policy):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False, freshness=policy)
+    calls = []
+
+    def fake_deep_clean(email):
+        calls.append(email)
+        return dict(SAMPLE_RESPONSE)
+    lw._deep_clean = fake_deep_clean
+    lw._insert_response(SAMPLE_RESPONSE, clean_type=1)
+    lw.db.cur.execute("UPDATE emails SET insertdate = '2001-01-01 00:00:00', updatedate = '2001-01-01 00:00:00'")
+    lw.db.con.commit()
+    return lw, calls
+
+
+def test_policy_is_stale():
+    policy = FreshnessPolicy(max_age_days={'clean': 10, 'spam-trap': None},
+                             now=lambda: datetime(2020, 1, 31))
+    assert policy.is_stale('clean', '2020-01-01 00:00:00')
+    assert not policy.is_stale('clean', '2020-01-25 00:00:00')
+    assert not policy.is_stale('spam-trap', '1990-01-01 00:00:00'), "None should never expire."
+    assert policy.is_stale('clean', None), "Missing dates should be treated as expired."
+    assert policy.in_window((8, 18)) is False
+    assert policy.in_window((22, 6)), "Expected the window to wrap midnight."
+
+
+def test_expired_entry_is_a_miss(tmp_path):
+    lw, calls = make_listwise(tmp_path, FreshnessPolicy())
+    assert lw.check_db(EMAIL) is None, "Expected an expired verdict to count as a cache miss."
+    assert lw.deep_clean_one2(EMAIL) == EMAIL
+    assert calls == [EMAIL]
+    row = lw.db.cur.execute("SELECT * FROM emails").fetchone()
+    assert row['insertdate'] == '2001-01-01 00:00:00', "Expected the refresh to keep the insertdate."
+    assert row['updatedate'] > '2001-01-01 00:00:00', "Expected the refresh to bump the updatedate."
+    assert lw.check_db(EMAIL) == {'email': EMAIL}
+
+
+def test_serve_stale_and_refresh(tmp_path):
+    lw, calls = make_listwise(tmp_path, FreshnessPolicy(serve_stale=True))
+    assert lw.check_db(EMAIL) == {'email': EMAIL}, "Expected the expired verdict to be served."
+    assert lw.db.count_records('refresh_queue') == 1, "Expected the expired verdict to be queued."
+    assert calls == []
+
+    assert lw.refresh_stale(budget=5, off_peak_hours=(25, 25)) == 0, "Expected nothing outside the window."
+    assert lw.refresh_stale(budget=5) == 1
+    assert calls == [EMAIL]
+    assert lw.db.count_records('refresh_queue') == 0
+    assert lw.refresh_stale(budget=5) == 0, "Expected nothing left to refresh."
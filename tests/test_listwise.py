@@ -11,12 +11,20 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 import listwise
 from listwise.ListWise import ERROR_CODE
+from listwise.cassette import cassette_transport, REPLAY
 
 #Sample dataframe with a real email address and a fake one.
 sample_emails = [['zekebarge@gmail.com'],['fakeemail']]
 df = pd.DataFrame(sample_emails, columns=['email'], index=range(len(sample_emails)))
 database_path = os.path.join(os.getcwd(), "listwise.db")
-lw = listwise.ListWise(database_path, username="fake_username", api_key="fake_key", test_credentials=False)
+
+#API responses are replayed from tests/data/listwise_api.jsonl (or LISTWISE_CASSETTE).
+#It holds only the invalid-key error_code asserted below until re-recorded from the live API.
+#Set LISTWISE_CASSETTE_MODE=record to call the live API and append its responses to the cassette.
+CASSETTE = os.environ.get('LISTWISE_CASSETTE', os.path.join(os.path.dirname(__file__), 'data', 'listwise_api.jsonl'))
+transport = cassette_transport(CASSETTE, mode=os.environ.get('LISTWISE_CASSETTE_MODE', REPLAY))
+lw = listwise.ListWise(database_path, username="fake_username", api_key="fake_key", test_credentials=False,
+                       transport=transport)
 
 #Sample response that would come from ListWise.
 SAMPLE_RESPONSE = dict(email='zekebarge@gmail.com',email_status='clean',free_mail='yes',typo_fixed='no',dealno=0,clean_type=1)
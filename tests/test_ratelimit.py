@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from listwise.ratelimit import TokenBucket, RateLimiter
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps on it."""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_bucket_limits_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(2.0, capacity=1, clock=clock, sleeper=clock.sleep)
+    for i in range(5):
+        bucket.acquire()
+    assert abs(clock.now - 1002.0) < 1e-6, "Expected 5 tokens at 2/sec with a burst of 1 to take 2 seconds."
+
+
+def test_bucket_backoff_and_recover():
+    clock = FakeClock()
+    bucket = TokenBucket(4.0, min_rate=1.0, recovery_step=1.0, clock=clock, sleeper=clock.sleep)
+    bucket.backoff()
+    assert bucket.rate == 2.0, "Expected the rate to be halved after a throttled response."
+    bucket.backoff()
+    bucket.backoff()
+    assert bucket.rate == 1.0, "Expected the rate to stop at min_rate."
+    for i in range(10):
+        bucket.recover()
+    assert bucket.rate == 4.0, "Expected the rate to recover up to the starting rate."
+
+
+def test_bucket_shared_between_instances(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "buckets.db")
+    b1 = TokenBucket(1.0, capacity=2, path=path, name='deep', clock=clock, sleeper=clock.sleep)
+    b2 = TokenBucket(1.0, capacity=2, path=path, name='deep', clock=clock, sleeper=clock.sleep)
+    assert b1.try_acquire() == 0
+    assert b2.try_acquire() == 0
+    assert b1.try_acquire() > 0, "Expected the second instance to have drained the shared bucket."
+    b2.backoff()
+    assert b1.rate == 0.5, "Expected backoff to be visible to every instance."
+    b1.close()
+    b2.close()
+
+
+def test_limiter_detects_throttling():
+    limiter = RateLimiter(rates={'deep': 4.0})
+    assert limiter.report('deep', 429, {}), "Expected HTTP 429 to count as throttled."
+    assert limiter.bucket('deep').rate == 2.0
+    assert not limiter.report('deep', 200, {'error_code': 2}), "Credential errors are not throttling."
+    assert limiter.report('deep', 200, {'error_code': 5})
+    assert limiter.bucket('quick').rate == 2.0, "Expected unknown endpoints to use the default rate."
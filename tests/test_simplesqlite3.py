@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.SimpleSQLite3 import SimpleSQLite3
+
+
+def make_db(tmp_path):
+    db = SimpleSQLite3(str(tmp_path / "test.db"), cached_statements=16)
+    db.cur.execute("CREATE TABLE people (name VARCHAR(30), age INT)")
+    db.cur.executemany("INSERT INTO people (name, age) VALUES (?,?)", [('ann', 30), ('bob', 40), ('cy', 50)])
+    db.con.commit()
+    return db
+
+
+def test_sql_exists_and_metadata(tmp_path):
+    db = make_db(tmp_path)
+    assert db.sql_exists('people')
+    assert db.sql_exists('PEOPLE'), "Table names are case-insensitive in SQLite."
+    assert db.sql_exists('people', fields=['name', 'age'])
+    assert not db.sql_exists('people', fields=['name', 'height'])
+    assert not db.sql_exists('nobody')
+    assert db.get_columns('people') == ['name', 'age']
+    assert db.show_tables() == ['people']
+    assert db.count_records('people') == 3
+
+
+def test_prepared_statements(tmp_path):
+    db = make_db(tmp_path)
+    db.prepare('people.older_than', "SELECT name FROM people WHERE age > ? ORDER BY age")
+    assert [r[0] for r in db.fetch_many('people.older_than', (35,))] == ['bob', 'cy']
+    assert db.fetch_many('people.older_than', (0,), size=1) == [('ann',)]
+    assert db.fetch_one('people.older_than', (100,)) is None
+    assert db.fetch_value("SELECT age FROM people WHERE name = ?", ('bob',)) == 40
+
+    db.prepare('people.delete', "DELETE FROM people WHERE name = ?")
+    db.executemany('people.delete', [('ann',), ('bob',)])
+    assert db.count_records('people') == 1
+
+
+def test_listwise_backend_uses_prepared_statements(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False, cached_statements=32)
+    assert lw.db.statement('emails.put') != 'emails.put'
+    lw._insert_response(dict(email='tony@yahoo.com', email_status='clean', free_mail='yes', typo_fixed='no'))
+    emails = ['tony@yahoo.com'] + ['missing{}@example.com'.format(i) for i in range(10)]
+    assert list(lw.backend.get_many(emails)) == ['tony@yahoo.com']
+    lw.queue_refresh('tony@yahoo.com')
+    assert lw.db.count_records('refresh_queue') == 1
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import threading
+from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.singleflight import SingleFlight
+
+SAMPLE_RESPONSE = dict(email='zekebarge@gmail.com', email_status='clean', free_mail='yes', typo_fixed='no')
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow(x):
+        started.set()
+        release.wait(5)
+        return x * 2
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.do, 'key', slow, 21)
+        started.wait(5)
+        followers = [pool.submit(flight.do, 'key', slow, 21) for i in range(3)]
+        while flight.shared < 3:
+            sleep(0.001)
+        release.set()
+        results = [leader.result()] + [f.result() for f in followers]
+
+    assert results == [42] * 4, "Expected every caller to get the leader's result."
+    assert flight.stats() == {'calls': 1, 'shared': 3}
+    assert flight.in_flight() == 0, "Expected the key to be forgotten once the call finished."
+    assert flight.do('key', lambda: 1) == 1, "Expected a new call after the first one completed."
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+    try:
+        flight.do('key', lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+    else:
+        raise AssertionError("Expected the leader's error to be raised.")
+    assert flight.in_flight() == 0
+
+
+def test_listwise_fetch_uses_single_flight(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    lw._deep_clean = lambda email: dict(SAMPLE_RESPONSE)
+    assert lw.deep_clean_one('zekebarge@gmail.com') == 'zekebarge@gmail.com'
+    assert lw.single_flight_stats == {'calls': 1, 'shared': 0}
+
+
+def test_listwise_threads_share_api_calls(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+
+    def slow_deep_clean(email):
+        for i in range(5000): # Hold the call open until the other thread joins it.
+            if lw.single_flight_stats['shared']:
+                break
+            sleep(0.001)
+        return dict(SAMPLE_RESPONSE)
+    lw._deep_clean = slow_deep_clean
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lw.deep_clean_one2, ['zekebarge@gmail.com'] * 2))
+    lw.db.con.commit()
+    assert results == ['zekebarge@gmail.com'] * 2
+    assert lw.single_flight_stats == {'calls': 1, 'shared': 1}
+    assert lw.check_db('zekebarge@gmail.com') == {'email': 'zekebarge@gmail.com'}
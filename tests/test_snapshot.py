@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.snapshot import EmailSnapshot
+
+RESPONSES = [dict(email='tony@yahoo.com', email_status='clean', free_mail='yes', typo_fixed='no'),
+             dict(email='spam@trap.com', email_status='spam-trap', free_mail='no', typo_fixed='no'),
+             dict(email='tina@gmail.com', email_status='catch-all', free_mail='yes', typo_fixed='no')]
+
+
+def test_export_and_load_snapshot(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    for r in RESPONSES:
+        lw._insert_response(r, clean_type=1)
+    lw._insert_response(dict(RESPONSES[0], email='quick@yahoo.com'), clean_type=0)
+    lw.db.con.commit()
+
+    path = str(tmp_path / "emails.npy")
+    assert lw.export_snapshot(path) == 4
+    snap = EmailSnapshot.load(path)
+    assert isinstance(snap.hashes, np.memmap), "Expected the snapshot to be memory-mapped."
+    assert np.all(snap.hashes[1:] > snap.hashes[:-1]), "Expected sorted, unique hashes."
+
+    assert snap.lookup('Tony@Yahoo.com ') == 'clean'
+    assert snap.lookup('spam@trap.com') == 'spam-trap'
+    assert snap.lookup('nobody@nowhere.com') is None
+    assert snap.lookup('quick@yahoo.com', clean_type=1) is None
+
+    emails = ['tony@yahoo.com', 'spam@trap.com', 'tina@gmail.com', 'nobody@nowhere.com', None]
+    assert snap.is_clean(emails).tolist() == [True, False, True, False, False]
+    assert snap.is_bad(emails).tolist() == [False, True, False, False, False]
+    assert snap.contains(emails).tolist() == [True, True, True, False, False]
+
+
+def test_last_record_wins():
+    snap = EmailSnapshot.from_records(['A@b.com', 'a@b.com'], ['bounced', 'clean'], [1, 1],
+                                      normalize=str.lower)
+    assert len(snap) == 1
+    assert snap.lookup('a@b.com') == 'clean'
+    assert len(EmailSnapshot.from_records([], [], [])) == 0
+    assert EmailSnapshot.from_records([], [], []).lookup('a@b.com') is None
+
+
+def test_snapshot_parses_lookups_like_suppress(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    lw._insert_response(dict(email='johndoe@gmail.com', email_status='bounced',
+                             free_mail='yes', typo_fixed='no'), clean_type=1)
+    lw.db.con.commit()
+
+    path = str(tmp_path / "emails.npy")
+    lw.export_snapshot(path)
+    assert os.path.exists(path + '.json')
+    snap = EmailSnapshot.load(path)
+    raw = 'JohnDoe@gmail.com;x@y.com'
+    assert snap.lookup(raw) == 'bounced'
+    assert snap.is_bad([raw]).tolist() == [True]
+    assert lw.suppress_email_mask(pd.Series([raw])).tolist() == [False]
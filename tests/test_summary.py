@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise import cli
+from listwise.backends import CacheBackend, MemoryBackend
+
+
+def response(email, status):
+    return dict(email=email, email_status=status, free_mail='no', typo_fixed='no')
+
+
+def fill(lw):
+    lw._insert_response(response('a@yahoo.com', 'clean'), dealno=7, clean_type=1)
+    lw._insert_response(response('b@yahoo.com', 'processing'), dealno=7, clean_type=1)
+    lw._insert_response(response('c@yahoo.com', 'processing'), dealno=7, clean_type=1)
+    lw._insert_response(response('d@yahoo.com', 'clean'), dealno=8, clean_type=0)
+    lw.backend.commit()
+
+
+def test_triggers_keep_counts(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    fill(lw)
+    assert lw.deal_summary(7) == {'clean': 1, 'processing': 2}
+    assert lw.deal_summary(8, clean_type=1) == {}
+
+    lw._insert_response(response('b@yahoo.com', 'clean'), dealno=7, clean_type=1)
+    lw.delete_email('a@yahoo.com')
+    assert lw.deal_summary(7) == {'clean': 1, 'processing': 1}
+
+    # A plain INSERT replaces the old row (ON CONFLICT REPLACE) - the recursive delete trigger un-counts it.
+    lw.db.cur.execute("INSERT INTO emails (email, email_status, dealno, clean_type) VALUES ('c@yahoo.com', 'bounced', 8, 0)")
+    lw.db.con.commit()
+    assert lw.deal_summary(7) == {'clean': 1}
+    assert lw.deal_summary(8) == {'clean': 1, 'bounced': 1}
+    assert lw.deal_summary(8) == CacheBackend.deal_summary(lw.backend, 8), "Expected the summary to match a scan."
+
+
+def test_summary_is_backfilled(tmp_path):
+    path = str(tmp_path / "listwise.db")
+    lw = listwise.ListWise(path, test_credentials=False)
+    fill(lw)
+    lw.db.cur.execute("DROP TABLE deal_status_counts")
+    for trigger in ('insert', 'update', 'delete'):
+        lw.db.cur.execute("DROP TRIGGER emails_count_{}".format(trigger))
+    lw.db.con.commit()
+    del lw
+
+    lw = listwise.ListWise(path, test_credentials=False)
+    assert lw.deal_summary(7) == {'clean': 1, 'processing': 2}
+    assert lw.deal_summary(7, clean_type=0) == {}
+
+
+def test_memory_backend_summary(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False, backend=MemoryBackend())
+    fill(lw)
+    assert lw.deal_summary(7) == {'clean': 1, 'processing': 2}
+
+
+def test_processing_rerun_uses_summary(tmp_path, capsys):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    fill(lw)
+    lw._deep_clean = lambda email: response(email, 'clean')
+    lw.deep_processing_rerun(dealno=7)
+    assert lw.deal_summary(7) == {'clean': 3}
+
+    cli.main(['--db', str(tmp_path / "listwise.db"), 'summary', '7'])
+    assert capsys.readouterr().out.splitlines()[-1] == 'clean: 3'
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+
+RESPONSES = [(dict(email='tony@yahoo.com', email_status='clean'), 1),
+             (dict(email='spam@trap.com', email_status='spam-trap'), 1),
+             (dict(email='tina@gmail.com', email_status='catch-all'), 1),
+             (dict(email='quick@bounce.com', email_status='bounced'), 0)]
+
+
+def make_listwise(tmp_path):
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    for r, clean_type in RESPONSES:
+        lw._insert_response(dict(r, free_mail='no', typo_fixed='no'), clean_type=clean_type)
+    lw.db.con.commit()
+    return lw
+
+
+def sample_frame():
+    return pd.DataFrame({'EMAIL': ['Tony@Yahoo.com', 'spam@trap.com', 'new@new.com', 'bad',
+                                   'quick@bounce.com', 'tina@gmail.com'],
+                         'NAME': ['a', 'b', 'c', 'd', 'e', 'f']})
+
+
+def test_suppress_email_frame(tmp_path):
+    lw = make_listwise(tmp_path)
+    df = lw.suppress_email_frame(sample_frame(), col='EMAIL', clean_type=1)
+    assert df['NAME'].tolist() == ['a', 'c', 'e', 'f'], "Expected bad deep cleaned & blank emails suppressed."
+    assert df['EMAIL'].tolist()[0] == 'tony@yahoo.com'
+    assert df['email_status'].isnull().all()
+
+    mask = lw.suppress_email_mask(sample_frame()['EMAIL'], clean_type=0)
+    assert mask.tolist() == [True, True, True, False, False, True]
+
+
+def test_merge_email_frame(tmp_path):
+    lw = make_listwise(tmp_path)
+    df = lw.merge_email_frame(sample_frame(), col='EMAIL')
+    assert df['NAME'].tolist() == ['a', 'f']
+    assert df['email_status'].tolist() == ['clean', 'catch-all']
+    assert lw.merge_email_mask(sample_frame()['EMAIL']).tolist() == [True, False, False, False, False, True]
+
+    sql = "SELECT email, email_status FROM emails WHERE email_status = 'clean'"
+    assert lw.merge_email_frame(sample_frame(), col='EMAIL', sql=sql)['NAME'].tolist() == ['a']
+
+
+def test_index_follows_database_changes(tmp_path):
+    lw = make_listwise(tmp_path)
+    assert lw.count_matching_emails(sample_frame(), col='EMAIL', verify_integrity=False) == 4
+    lw.delete_email('tony@yahoo.com')
+    lw.db.con.commit()
+    assert lw.count_matching_emails(sample_frame(), col='EMAIL', verify_integrity=False) == 3, \
+        "Expected the hash index to be rebuilt after a delete."
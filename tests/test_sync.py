@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import sqlite3
+import time
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise import sync
+from listwise.ListWise import EMAILS_SQL_TABLE
+
+SYNC_UPDATEDATE = sync.SYNC_FIELDS.index('updatedate')
+
+
+def response(email, status):
+    return dict(email=email, email_status=status, free_mail='no', typo_fixed='no')
+
+
+def make_node(tmp_path, name):
+    lw = listwise.ListWise(str(tmp_path / "{}.db".format(name)), test_credentials=False)
+    lw._deep_clean = lambda email: (_ for _ in ()).throw(AssertionError("Unexpected API call for " + email))
+    return lw
+
+
+def set_updatedate(lw, email, date):
+    lw.db.cur.execute("UPDATE emails SET updatedate = ? WHERE email = ?", (date, email))
+    lw.db.con.commit()
+
+
+def test_export_import(tmp_path):
+    a, b = make_node(tmp_path, 'a'), make_node(tmp_path, 'b')
+    assert a.node_id != b.node_id
+    a._insert_response(response('tony@yahoo.com', 'clean'), clean_type=1)
+    a._insert_response(response('spam@trap.com', 'spam-trap'), clean_type=1)
+    a._insert_response(response('stuck@slow.com', 'processing'), clean_type=1)
+    a.db.con.commit()
+
+    path = str(tmp_path / "a.delta.gz")
+    assert a.export_changes(path, since=b.sync_watermark(a.node_id)) == 2, "Processing rows aren't synced."
+    assert b.import_changes(path) == 2
+    assert b.check_db('tony@yahoo.com') == {'email': 'tony@yahoo.com'}, "Expected a cache hit without an API call."
+    assert b.sync_watermark(a.node_id) > 0
+    assert b.import_changes(path) == 0, "Expected re-importing a delta to change nothing."
+    assert a.import_changes(path) == 0, "Expected a node to skip its own delta."
+
+    # Nothing new since the watermark - and the imported rows echo back to A without changing anything.
+    assert a.export_changes(path, since=b.sync_watermark(a.node_id)) == 0
+    assert b.export_changes(path) == 2
+    assert a.import_changes(path) == 0
+
+
+def test_out_of_order_import(tmp_path):
+    a, b = make_node(tmp_path, 'a'), make_node(tmp_path, 'b')
+    a._insert_response(response('one@x.com', 'clean'), clean_type=1)
+    a.db.con.commit()
+    first = str(tmp_path / "1.delta.gz")
+    a.export_changes(first, since=0)
+    seq = sync.change_seq(a.db)
+    a._insert_response(response('two@x.com', 'clean'), clean_type=1)
+    a.db.con.commit()
+    second = str(tmp_path / "2.delta.gz")
+    a.export_changes(second, since=seq)
+
+    assert b.import_changes(second) == 1
+    assert b.sync_watermark(a.node_id) == 0, "Expected a gap to leave the watermark alone."
+    assert b.import_changes(first) == 1
+    assert b.sync_watermark(a.node_id) == seq
+    assert b.import_changes(second) == 0
+    assert b.sync_watermark(a.node_id) == sync.change_seq(a.db)
+    assert set(b.backend.get_many(['one@x.com', 'two@x.com'])) == {'one@x.com', 'two@x.com'}
+
+
+def test_conflict_resolution(tmp_path):
+    a, b = make_node(tmp_path, 'a'), make_node(tmp_path, 'b')
+    # Deep beats quick even when the quick verdict is newer.
+    a._insert_response(response('deep@yahoo.com', 'clean'), clean_type=1)
+    b._insert_response(response('deep@yahoo.com', 'invalid'), clean_type=0)
+    # Same clean_type - the newest verdict wins.
+    a._insert_response(response('old@yahoo.com', 'clean'), clean_type=1)
+    b._insert_response(response('old@yahoo.com', 'bounced'), clean_type=1)
+    a._insert_response(response('new@yahoo.com', 'clean'), clean_type=1)
+    b._insert_response(response('new@yahoo.com', 'bounced'), clean_type=1)
+    set_updatedate(a, 'deep@yahoo.com', '2026-01-01 00:00:00')
+    set_updatedate(b, 'deep@yahoo.com', '2026-06-01 00:00:00')
+    set_updatedate(a, 'old@yahoo.com', '2026-01-01 00:00:00')
+    set_updatedate(b, 'old@yahoo.com', '2026-06-01 00:00:00')
+    set_updatedate(a, 'new@yahoo.com', '2026-06-01 00:00:00')
+    set_updatedate(b, 'new@yahoo.com', '2026-01-01 00:00:00')
+
+    path = str(tmp_path / "a.delta.gz")
+    a.export_changes(path)
+    assert b.import_changes(path) == 2
+    records = b.backend.get_many(['deep@yahoo.com', 'old@yahoo.com', 'new@yahoo.com'])
+    assert (records['deep@yahoo.com']['email_status'], records['deep@yahoo.com']['clean_type']) == ('clean', 1)
+    assert records['old@yahoo.com']['email_status'] == 'bounced'
+    assert records['new@yahoo.com']['email_status'] == 'clean'
+    assert records['new@yahoo.com']['updatedate'] == '2026-06-01 00:00:00', "Expected the verdict date to be kept."
+    assert b.deal_summary(0, clean_type=1) == {'clean': 2, 'bounced': 1}
+
+
+def test_existing_database_is_upgraded(tmp_path):
+    path = str(tmp_path / "old.db")
+    con = sqlite3.connect(path)
+    con.execute(EMAILS_SQL_TABLE.replace(",\n    change_seq   INTEGER", ""))
+    con.execute("INSERT INTO emails (email, email_status, clean_type) VALUES ('tony@yahoo.com', 'clean', 1)")
+    con.commit()
+    con.close()
+
+    lw = make_node(tmp_path, 'old')
+    assert lw.export_changes(str(tmp_path / "old.delta.gz")) == 1
+    lw._insert_response(response('tina@gmail.com', 'clean'), clean_type=1)
+    lw.db.con.commit()
+    assert lw.export_changes(str(tmp_path / "old.delta.gz"), since=1) == 1
+
+
+def test_cli_sync(tmp_path):
+    from listwise import cli
+    a, b = make_node(tmp_path, 'a'), make_node(tmp_path, 'b')
+    a._insert_response(response('tony@yahoo.com', 'clean'), clean_type=1)
+    a.db.con.commit()
+    delta = str(tmp_path / "a.delta.gz")
+    cli.main(['--db', str(tmp_path / "a.db"), 'sync-export', delta, '--peer-db', str(tmp_path / "b.db")])
+    cli.main(['--db', str(tmp_path / "b.db"), 'sync-import', delta])
+    assert b.check_db('tony@yahoo.com') == {'email': 'tony@yahoo.com'}
+
+
+def test_nodes_in_different_timezones(tmp_path):
+    orig_tz = os.environ.get('TZ', None)
+
+    def set_tz(tz):
+        os.environ['TZ'] = tz
+        time.tzset()
+    try:
+        a, b = make_node(tmp_path, 'a'), make_node(tmp_path, 'b')
+        set_tz('Asia/Tokyo')
+        b._insert_response(response('tony@yahoo.com', 'bounced'), clean_type=1)
+        set_updatedate(b, 'tony@yahoo.com', '2026-10-20 20:00:00') # 11:00 UTC
+
+        set_tz('America/New_York')
+        a._insert_response(response('tony@yahoo.com', 'clean'), clean_type=1)
+        set_updatedate(a, 'tony@yahoo.com', '2026-10-20 10:00:00') # 14:00 UTC - newer.
+        path = str(tmp_path / "a.delta.gz")
+        a.export_changes(path)
+        assert sync.read_changes(path)[1][0][SYNC_UPDATEDATE] == '2026-10-20 14:00:00'
+
+        set_tz('Asia/Tokyo')
+        assert b.import_changes(path) == 1, "Expected the newer (in UTC) verdict to win."
+        assert b.check_db('tony@yahoo.com') == {'email': 'tony@yahoo.com'}
+        assert b.db.fetch_value("SELECT updatedate FROM emails") == '2026-10-20 23:00:00'
+        b.export_changes(path)
+        set_tz('America/New_York')
+        assert a.import_changes(path) == 0, "Expected the same instant not to replace itself."
+    finally:
+        if orig_tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = orig_tz
+        time.tzset()
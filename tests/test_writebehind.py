@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import threading
+import pytest
+import pandas as pd
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import listwise
+from listwise.backends import MemoryBackend, make_record
+from listwise.writebehind import WriteBehindWriter
+
+
+class SlowBackend(MemoryBackend):
+    """Holds every write until release is set."""
+    def __init__(self):
+        MemoryBackend.__init__(self)
+        self.release = threading.Event()
+
+    def put_many(self, records):
+        self.release.wait()
+        MemoryBackend.put_many(self, records)
+
+
+class BrokenBackend(MemoryBackend):
+    def put_many(self, records):
+        raise IOError("disk full")
+
+
+def response_for(email, status='clean'):
+    return dict(email=email, email_status=status, free_mail='no', typo_fixed='no')
+
+
+def record(email, status='clean'):
+    return make_record(dict(email=email, email_status=status), clean_type=1)
+
+
+def test_writer_batches_and_flushes():
+    backend = SlowBackend()
+    writer = WriteBehindWriter(lambda: backend, max_queue=100, batch_size=10)
+    for i in range(25):
+        writer.put(record("user{}@example.com".format(i)))
+    assert set(writer.pending(['user0@example.com', 'user24@example.com', 'nope@example.com'])) == \
+        {'user0@example.com', 'user24@example.com'}, "Expected unwritten records to be visible."
+    backend.release.set()
+    writer.flush()
+    assert backend.count() == 25
+    assert writer.pending(['user24@example.com']) == {}
+    assert writer.written == 25 and writer.batches >= 3
+    writer.close()
+
+
+def test_writer_errors_surface_on_flush():
+    writer = WriteBehindWriter(lambda: BrokenBackend())
+    writer.put(record('tony@yahoo.com'))
+    with pytest.raises(IOError):
+        writer.flush()
+    writer.close()
+
+
+def test_listwise_write_behind(tmp_path):
+    calls = []
+
+    def fake_deep_clean(email):
+        calls.append(email)
+        status = ('invalid' if email.startswith('bad') else 'clean')
+        return dict(email=email, email_status=status, free_mail='no', typo_fixed='no')
+
+    df = pd.DataFrame({'email': ['tony@yahoo.com', 'bad@yahoo.com', 'tina@gmail.com', 'tony@yahoo.com']})
+    with listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False, write_behind=50) as lw:
+        lw._deep_clean = fake_deep_clean
+        out = lw.deep_clean_frame(df.copy(), workers=4)
+        assert out['EMAIL_CLEANED'].tolist() == ['tony@yahoo.com', '', 'tina@gmail.com', 'tony@yahoo.com']
+        # Written by the writer thread's connection, visible to this one after deep_clean_frame.
+        assert lw.db.count_records('emails') == 3
+        assert lw.metrics['writes'] == 3
+
+        lw.deep_clean_one('new@yahoo.com')
+        assert lw.check_db('new@yahoo.com') == {'email': 'new@yahoo.com'}
+        assert lw.suppress_email_mask(pd.Series(['new@yahoo.com', 'bad@yahoo.com'])).tolist() == [True, False]
+    assert sorted(calls) == ['bad@yahoo.com', 'new@yahoo.com', 'tina@gmail.com', 'tony@yahoo.com']
+
+    lw = listwise.ListWise(str(tmp_path / "listwise.db"), test_credentials=False)
+    assert lw.db.count_records('emails') == 4, "Expected close() to flush the last response."
+
+
+def test_deletes_go_through_the_writer(tmp_path):
+    path = str(tmp_path / "listwise.db")
+    lw = listwise.ListWise(path, test_credentials=False)
+    lw._insert_response(response_for('tony@yahoo.com;tory@yahoo.com'), dealno=3, clean_type=1)
+    lw.backend.commit()
+    del lw
+
+    with listwise.ListWise(path, test_credentials=False, write_behind=True) as lw:
+        lw._deep_clean = lambda email: response_for(email)
+        start = time.time()
+        for i in range(3):
+            lw.deep_clean_one('user{}@yahoo.com'.format(i))
+            lw.delete_email('user{}@yahoo.com'.format(i))
+            assert lw.check_db('user{}@yahoo.com'.format(i)) is None, "Expected a queued delete to hide the record."
+            lw.flush()
+        lw._reparse_database_emails()
+        lw.queue_refresh('tony@yahoo.com')
+        lw.flush()
+        assert time.time() - start < 4, "Expected no waiting on the database lock."
+        assert lw.backend.read_frame()['email'].tolist() == ['tony@yahoo.com']
+        assert lw.db.count_records('refresh_queue') == 1